@@ -0,0 +1,191 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+from chia.util.byte_types import hexstr_to_bytes
+
+from beacon_coin.wallet import BeaconWallet
+
+# how many reads run against the node at once
+READ_CONCURRENCY = 32
+
+READ_OPS = {"get-data"}
+WRITE_OPS = {
+    "mint",
+    "add-pair",
+    "remove-pair",
+    "replace-pair",
+    "set",
+    "remove-key",
+    "freeze",
+    "change-owner",
+}
+
+
+# fields an op needs besides launcher_id and optional fee
+REQUIRED = {
+    "add-pair": ("key", "value"),
+    "remove-pair": ("index",),
+    "replace-pair": ("index", "key", "value"),
+    "set": ("key", "value"),
+    "remove-key": ("key",),
+    "change-owner": ("new_pub_key",),
+}
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_operation(line: str) -> dict:
+    operation = json.loads(line)
+    if not isinstance(operation, dict):
+        raise ValueError("Operation must be a JSON object")
+    op = operation.get("op")
+    if op not in READ_OPS | WRITE_OPS:
+        raise ValueError(f"Unknown op: {op}")
+    if op != "mint":
+        launcher_id = operation.get("launcher_id")
+        if not isinstance(launcher_id, str) or len(launcher_id) != 66:
+            raise ValueError("launcher_id must start with 0x and be 66 chars long")
+        if not launcher_id.startswith("0x"):
+            raise ValueError("launcher_id must start with 0x")
+        try:
+            operation["launcher_id"] = hexstr_to_bytes(launcher_id)
+        except ValueError:
+            raise ValueError("launcher_id is not valid hex")
+    fee = operation.get("fee", 0)
+    if not _is_int(fee) or fee < 0:
+        raise ValueError("fee must be a non-negative integer")
+    for field in REQUIRED.get(op, ()):
+        if field not in operation:
+            raise ValueError(f"{op} needs {field}")
+    if "index" in REQUIRED.get(op, ()):
+        if not _is_int(operation["index"]) or operation["index"] < 0:
+            raise ValueError("index must be a non-negative integer")
+    if op == "change-owner" and not isinstance(operation["new_pub_key"], str):
+        raise ValueError("new_pub_key must be a string")
+    return operation
+
+
+def _resources(operation: dict) -> List[bytes]:
+    # things a write must hold exclusively until it's confirmed, wallet coins
+    # for fees are reserved by the wallet itself
+    if operation["op"] == "mint":
+        return []
+    return [operation["launcher_id"]]
+
+
+async def _execute(wallet: BeaconWallet, operation: dict, wait: bool) -> dict:
+    op = operation["op"]
+    fee = operation.get("fee", 0)
+    if op == "get-data":
+        version, data = await wallet.get_data(operation["launcher_id"])
+        return {"version": version, "data": [(i, x) for i, x in enumerate(data)]}
+    if op == "mint":
+        tx_id, launcher_id = await wallet.mint(fee=fee, wait=wait)
+        return {"tx_id": tx_id.hex(), "launcher_id": "0x" + launcher_id.hex()}
+    launcher_id = operation["launcher_id"]
+    if op == "add-pair":
+        pair = (operation["key"], operation["value"])
+        tx_id = await wallet.add_pair(launcher_id, pair, fee=fee, wait=wait)
+    elif op == "remove-pair":
+        tx_id = await wallet.remove_pair_at(
+            launcher_id, operation["index"], fee=fee, wait=wait
+        )
+    elif op == "replace-pair":
+        pair = (operation["key"], operation["value"])
+        tx_id = await wallet.replace_pair_at(
+            launcher_id, operation["index"], pair, fee=fee, wait=wait
+        )
+    elif op == "set":
+        tx_id = await wallet.set_pair(
+            launcher_id, operation["key"], operation["value"], fee=fee, wait=wait
+        )
+    elif op == "remove-key":
+        tx_id = await wallet.remove_key(
+            launcher_id, operation["key"], fee=fee, wait=wait
+        )
+    elif op == "freeze":
+        tx_id = await wallet.freeze(launcher_id, fee=fee, wait=wait)
+    else:
+        tx_id = await wallet.set_ownership(
+            launcher_id, operation["new_pub_key"], fee=fee, wait=wait
+        )
+    return {"tx_id": tx_id.hex()}
+
+
+async def _run(
+    wallet: BeaconWallet,
+    operation: Optional[dict],
+    error: Optional[str],
+    after: List[asyncio.Task],
+    wait: bool,
+    reads: asyncio.Semaphore,
+) -> dict:
+    result = {}
+    if operation is not None and "id" in operation:
+        result["id"] = operation["id"]
+    if error is not None:
+        result["error"] = error
+        return result
+    result["op"] = operation["op"]
+    # earlier tasks never raise, errors end up in their results
+    await asyncio.gather(*after)
+    try:
+        if operation["op"] in READ_OPS:
+            async with reads:
+                result.update(await _execute(wallet, operation, wait))
+        else:
+            result.update(await _execute(wallet, operation, wait))
+    except Exception as e:
+        result["error"] = str(e) or repr(e)
+    return result
+
+
+async def run_batch(
+    wallet: BeaconWallet, lines: List[str], read_concurrency=READ_CONCURRENCY
+) -> AsyncIterator[dict]:
+    """Runs JSONL operations concurrently and yields results in input order.
+
+    Operations only wait for earlier writes to the same launcher, at most
+    `read_concurrency` reads run at once. Writes are pushed with wait=True
+    when a later operation on their launcher depends on them."""
+    parsed = []
+    for line in lines:
+        try:
+            parsed.append((parse_operation(line), None))
+        except Exception as e:
+            parsed.append((None, str(e)))
+
+    # a write has to be confirmed before the next operation on any of its
+    # resources can build on it
+    needs_wait = [False] * len(parsed)
+    last_write: Dict[bytes, int] = {}
+    for i, (operation, _) in enumerate(parsed):
+        if operation is None:
+            continue
+        for resource in _resources(operation):
+            if resource in last_write:
+                needs_wait[last_write[resource]] = True
+            if operation["op"] in WRITE_OPS:
+                last_write[resource] = i
+
+    reads = asyncio.Semaphore(read_concurrency)
+    tasks: List[asyncio.Task] = []
+    writers: Dict[bytes, asyncio.Task] = {}
+    for i, (operation, error) in enumerate(parsed):
+        after = []
+        if operation is not None:
+            resources = _resources(operation)
+            after = [writers[r] for r in resources if r in writers]
+        task = asyncio.ensure_future(
+            _run(wallet, operation, error, after, needs_wait[i], reads)
+        )
+        if operation is not None and operation["op"] in WRITE_OPS:
+            for resource in resources:
+                writers[resource] = task
+        tasks.append(task)
+
+    for task in tasks:
+        yield await task
@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from beacon_coin import driver
+
+# most spends requested at once that go to a single executor call
+BATCH_SIZE = 16
+
+
+def _run_batch(jobs: List[Tuple[Callable, tuple]]) -> List[Tuple[bool, Any]]:
+    results = []
+    for fn, args in jobs:
+        try:
+            results.append((True, fn(*args)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class SpendBuilder:
+    """Runs CPU heavy spend building off the event loop.
+
+    Jobs submitted during the same loop iteration are sent to the executor
+    together, in batches of up to `batch_size`, so a process pool doesn't pay
+    for a round trip per spend. With no workers, loop's default thread pool is
+    used. Wallet key `sk` is registered once in each worker process, jobs have
+    to be picklable for a process pool, see driver.build_*.
+    """
+
+    def __init__(self, sk: bytes, workers=0, batch_size=BATCH_SIZE):
+        driver.register_key(sk)
+        self.executor: Optional[Executor] = None
+        if workers > 0:
+            self.executor = ProcessPoolExecutor(
+                workers, initializer=driver.register_key, initargs=(sk,)
+            )
+        self.batch_size = batch_size
+        self._queue: List[Tuple[Callable, tuple, asyncio.Future]] = []
+        self._scheduled = False
+
+    async def build(self, fn: Callable, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((fn, args, future))
+        if len(self._queue) >= self.batch_size:
+            self._flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        self._scheduled = False
+        jobs, self._queue = self._queue, []
+        if not jobs:
+            return
+        loop = asyncio.get_running_loop()
+        batch = loop.run_in_executor(
+            self.executor, _run_batch, [(fn, args) for fn, args, _ in jobs]
+        )
+
+        def done(batch: asyncio.Future):
+            if batch.cancelled():
+                results = [(False, asyncio.CancelledError())] * len(jobs)
+            elif batch.exception() is not None:
+                results = [(False, batch.exception())] * len(jobs)
+            else:
+                results = batch.result()
+            for (_, _, future), (ok, result) in zip(jobs, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+        batch.add_done_callback(done)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -5,7 +5,9 @@ from chia.util.byte_types import hexstr_to_bytes
 import json
 import click
 
-from beacon_coin.wallet import BeaconWallet
+from beacon_coin.batch import run_batch
+from beacon_coin.encoding import COMPRESS_THRESHOLD
+from beacon_coin.wallet import BeaconWallet, CoinNotFound, TxNotConfirmed
 
 VERBOSE = False
 
@@ -13,7 +15,16 @@ VERBOSE = False
 def coro(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        return asyncio.run(f(*args, **kwargs))
+        try:
+            return asyncio.run(f(*args, **kwargs))
+        except TxNotConfirmed as e:
+            # only evicted ones end up here when waiting without a timeout
+            raise click.ClickException(
+                f"Transaction {e.tx_id} was {e.status.value} from the mempool, "
+                "nothing was changed on chain."
+            )
+        except CoinNotFound as e:
+            raise click.ClickException(f"{e}, check the launcher ID.")
 
     return wrapper
 
@@ -24,6 +35,16 @@ def debug(msg):
         click.echo(msg)
 
 
+class BytesDump(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, bytes):
+            try:
+                return obj.decode()
+            except UnicodeDecodeError:
+                return "0x" + obj.hex()
+        return json.JSONEncoder.default(self, obj)
+
+
 def parse_launcher(ctx, param, value):
     try:
         if not value:
@@ -54,9 +75,29 @@ def parse_launcher(ctx, param, value):
     help="Key fingerprint, will default to first one it finds if not provided.",
     default=None,
 )
+@click.option(
+    "--compress-threshold",
+    type=int,
+    default=COMPRESS_THRESHOLD,
+    show_default=True,
+    help="Compress stored values of at least this many bytes, 0 disables it.",
+)
+@click.option(
+    "--snapshot",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Snapshot file to seed beacon state from, see `snapshot export`.",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Build and sign spends in this many processes, 0 uses a thread.",
+)
 @click.option("-v", "--verbose", help="Show more debugging info.", is_flag=True)
 @click.pass_context
-def cli(ctx, config_path, fingerprint, verbose):
+def cli(ctx, config_path, fingerprint, compress_threshold, snapshot, workers, verbose):
     """Manage beacon coins on Chia network.
 
     They can be used to store key information in a decentralized and durable way."""
@@ -64,7 +105,14 @@ def cli(ctx, config_path, fingerprint, verbose):
         global VERBOSE
         VERBOSE = True
     debug(f"Connecting to wallet...")
-    wallet = BeaconWallet.create(fingerprint, config_path, verbose=verbose)
+    wallet = BeaconWallet.create(
+        fingerprint,
+        config_path,
+        verbose=verbose,
+        compress_threshold=compress_threshold or None,
+        snapshot_path=snapshot,
+        workers=workers,
+    )
     ctx.obj = wallet
 
 
@@ -75,13 +123,18 @@ def cli(ctx, config_path, fingerprint, verbose):
     default=0,
     help="Transaction fee, defaults to 0",
 )
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
 @coro
 @click.pass_context
-async def mint(ctx, fee):
+async def mint(ctx, fee, wait):
     wallet: BeaconWallet
     async with ctx.obj as wallet:
         debug("Minting a new coin for wallet: %s" % wallet.wallet_address)
-        tx_id, launcher_id = await wallet.mint(fee=fee)
+        tx_id, launcher_id = await wallet.mint(fee=fee, wait=wait)
         debug("Got back tx_id: %s, launcher_id: %s" % (tx_id, launcher_id))
         if tx_id and launcher_id:
             click.echo(
@@ -104,18 +157,23 @@ async def mint(ctx, fee):
     default=0,
     help="Transaction fee, defaults to 0",
 )
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
 @click.argument("launcher-id", callback=parse_launcher)
 @click.argument("key", type=str)
 @click.argument("value", type=str)
 @coro
 @click.pass_context
-async def add_pair(ctx, launcher_id, key, value, fee):
+async def add_pair(ctx, launcher_id, key, value, fee, wait):
     wallet: BeaconWallet
     async with ctx.obj as wallet:
         debug(
             f"Adding pair ({repr(key)}, {repr(value)}) to beacon coin: {launcher_id.hex()}"
         )
-        tx_id = await wallet.add_pair(launcher_id, (key, value), fee=fee)
+        tx_id = await wallet.add_pair(launcher_id, (key, value), fee=fee, wait=wait)
         click.echo(f"Added pair ('{key}', '{value}') using transaction: {tx_id}")
 
 
@@ -129,18 +187,113 @@ async def add_pair(ctx, launcher_id, key, value, fee):
     default=0,
     help="Transaction fee, defaults to 0",
 )
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
 @click.argument("launcher-id", callback=parse_launcher)
-@click.argument("index", type=int)
+@click.argument("index", type=click.IntRange(min=0))
 @coro
 @click.pass_context
-async def remove_pair_at(ctx, launcher_id, index: int, fee: int):
+async def remove_pair_at(ctx, launcher_id, index: int, fee: int, wait: bool):
     wallet: BeaconWallet
     async with ctx.obj as wallet:
         debug(f"Removing pair at index {index} from beacon coin: {launcher_id}")
-        tx_id = await wallet.remove_pair_at(launcher_id, index, fee)
+        tx_id = await wallet.remove_pair_at(launcher_id, index, fee, wait=wait)
         click.echo(f"Removed pair at {index} using transaction: {tx_id}")
 
 
+@click.command(
+    name="replace-pair",
+    help="Replace a pair at a specifed index in coin data.\n\nOnly works on mutable coins.",
+)
+@click.option(
+    "--fee",
+    type=int,
+    default=0,
+    help="Transaction fee, defaults to 0",
+)
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
+@click.argument("launcher-id", callback=parse_launcher)
+@click.argument("index", type=click.IntRange(min=0))
+@click.argument("key", type=str)
+@click.argument("value", type=str)
+@coro
+@click.pass_context
+async def replace_pair_at(ctx, launcher_id, index, key, value, fee, wait):
+    wallet: BeaconWallet
+    async with ctx.obj as wallet:
+        debug(f"Replacing pair at index {index} in beacon coin: {launcher_id.hex()}")
+        tx_id = await wallet.replace_pair_at(
+            launcher_id, index, (key, value), fee=fee, wait=wait
+        )
+        click.echo(
+            f"Replaced pair at {index} with ('{key}', '{value}') using transaction: {tx_id}"
+        )
+
+
+@click.command(
+    name="set",
+    help="Set value of a key in coin data.\n\nReplaces the first pair with KEY or prepends a new one if there's none. Only works on mutable coins.",
+)
+@click.option(
+    "--fee",
+    type=int,
+    default=0,
+    help="Transaction fee, defaults to 0",
+)
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
+@click.argument("launcher-id", callback=parse_launcher)
+@click.argument("key", type=str)
+@click.argument("value", type=str)
+@coro
+@click.pass_context
+async def set_pair(ctx, launcher_id, key, value, fee, wait):
+    wallet: BeaconWallet
+    async with ctx.obj as wallet:
+        debug(
+            f"Setting {repr(key)} to {repr(value)} on beacon coin: {launcher_id.hex()}"
+        )
+        tx_id = await wallet.set_pair(launcher_id, key, value, fee=fee, wait=wait)
+        click.echo(f"Set '{key}' to '{value}' using transaction: {tx_id}")
+
+
+@click.command(
+    name="remove-key",
+    help="Remove all pairs with a key from coin data.\n\nOnly works on mutable coins.",
+)
+@click.option(
+    "--fee",
+    type=int,
+    default=0,
+    help="Transaction fee, defaults to 0",
+)
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
+@click.argument("launcher-id", callback=parse_launcher)
+@click.argument("key", type=str)
+@coro
+@click.pass_context
+async def remove_key(ctx, launcher_id, key, fee, wait):
+    wallet: BeaconWallet
+    async with ctx.obj as wallet:
+        debug(f"Removing key {repr(key)} from beacon coin: {launcher_id.hex()}")
+        tx_id = await wallet.remove_key(launcher_id, key, fee=fee, wait=wait)
+        click.echo(f"Removed key '{key}' using transaction: {tx_id}")
+
+
 @click.command(name="freeze", help="Freezing makes the coin immutable")
 @click.option(
     "--fee",
@@ -148,14 +301,19 @@ async def remove_pair_at(ctx, launcher_id, index: int, fee: int):
     default=0,
     help="Transaction fee, defaults to 0",
 )
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
 @click.argument("launcher-id", callback=parse_launcher)
 @coro
 @click.pass_context
-async def freeze(ctx, launcher_id, fee):
+async def freeze(ctx, launcher_id, fee, wait):
     wallet: BeaconWallet
     async with ctx.obj as wallet:
         debug(f"Freezing beacon coin: {launcher_id}")
-        tx_id = await wallet.freeze(launcher_id, fee=fee)
+        tx_id = await wallet.freeze(launcher_id, fee=fee, wait=wait)
         click.echo(f"Beacon coin frozen using transaction: {tx_id}")
 
 
@@ -168,23 +326,33 @@ async def freeze(ctx, launcher_id, fee):
     default=0,
     help="Transaction fee, defaults to 0",
 )
+@click.option(
+    "--wait",
+    is_flag=True,
+    help="Wait until the transaction is confirmed on chain.",
+)
 @click.argument("launcher-id", callback=parse_launcher)
 @click.argument("new-pub-key")
 @coro
 @click.pass_context
-async def change_owner(ctx, launcher_id, new_pub_key, fee):
+async def change_owner(ctx, launcher_id, new_pub_key, fee, wait):
     wallet: BeaconWallet
     async with ctx.obj as wallet:
         debug(f"Changing ownership to {new_pub_key} on beacon coin: {launcher_id}")
-        tx_id = await wallet.set_ownership(launcher_id, new_pub_key, fee=fee)
+        tx_id = await wallet.set_ownership(launcher_id, new_pub_key, fee=fee, wait=wait)
         click.echo(f"Ownership changed to {new_pub_key} using transaction: {tx_id}")
 
 
 @click.command(name="get-data")
+@click.option(
+    "--sizes",
+    is_flag=True,
+    help="Include stored and uncompressed size of each value.",
+)
 @click.argument("launcher-id", callback=parse_launcher)
 @coro
 @click.pass_context
-async def get_data(ctx, launcher_id):
+async def get_data(ctx, launcher_id, sizes):
     """Returns a JSON of coin data and metadata
 
     Can be piped into other commands."""
@@ -197,22 +365,111 @@ async def get_data(ctx, launcher_id):
             "version": data[0],
             "data": [(i, x) for i, x in enumerate(data[1])],
         }
+        if sizes:
+            report = await wallet.get_data_report(launcher_id)
+            pretty_data["sizes"] = [(i, x) for i, x in enumerate(report)]
+        click.echo(json.dumps(pretty_data, cls=BytesDump))
 
-        class BytesDump(json.JSONEncoder):
-            def default(self, obj):
-                if isinstance(obj, bytes):
-                    return obj.decode()
-                return json.JSONEncoder.default(self, obj)
 
-        click.echo(json.dumps(pretty_data, cls=BytesDump))
+@click.command(name="batch")
+@click.argument("input", type=click.File("r"), default="-")
+@coro
+@click.pass_context
+async def batch(ctx, input):
+    """Run JSONL operations from INPUT (or stdin) in a single wallet session.
+
+    Each line is an object with "op" set to one of mint, add-pair, remove-pair,
+    replace-pair, set, remove-key, freeze, change-owner or get-data and the same
+    arguments as the matching command (launcher_id, key, value, index,
+    new_pub_key, fee). Writes one JSON result per input line, in input order.
+
+    Reads run concurrently, writes to the same launcher are applied in order,
+    each one waiting for the previous to be confirmed."""
+    lines = [line for line in input if line.strip()]
+    wallet: BeaconWallet
+    async with ctx.obj as wallet:
+        debug(f"Running {len(lines)} operations")
+        async for result in run_batch(wallet, lines):
+            click.echo(json.dumps(result, cls=BytesDump))
+
+
+@click.group(name="snapshot")
+def snapshot():
+    """Export and import beacon state for fast bootstrap."""
+
+
+def echo_failures(failures: dict):
+    for launcher_id, error in failures.items():
+        click.echo(f"Skipped {launcher_id.hex()}: {error}", err=True)
+
+
+@snapshot.command(name="export")
+@click.option(
+    "--ids-file",
+    type=click.File("r"),
+    default=None,
+    help="File with one launcher ID per line, use - for stdin.",
+)
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.argument("launcher-ids", nargs=-1)
+@coro
+@click.pass_context
+async def snapshot_export(ctx, output, launcher_ids, ids_file):
+    """Write current state of beacons to a snapshot file.
+
+    Use it with `--snapshot` or `snapshot import` to skip walking lineage of
+    every beacon from its launcher."""
+    launcher_ids = list(launcher_ids)
+    if ids_file:
+        launcher_ids.extend(line.strip() for line in ids_file if line.strip())
+    launcher_ids = [parse_launcher(ctx, None, x) for x in launcher_ids]
+    wallet: BeaconWallet
+    async with ctx.obj as wallet:
+        debug(f"Exporting {len(launcher_ids)} beacon coins to {output}")
+        states, failures = await wallet.export_snapshot(output, launcher_ids)
+        echo_failures(failures)
+        click.echo(f"Exported {len(states)} beacon coins to {output}")
+
+
+@snapshot.command(name="import")
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write caught up state to this snapshot file.",
+)
+@click.argument("input", type=click.Path(exists=True, dir_okay=False))
+@coro
+@click.pass_context
+async def snapshot_import(ctx, input, output):
+    """Load a snapshot, verify tips and catch up stale beacons."""
+    wallet: BeaconWallet
+    async with ctx.obj as wallet:
+        launcher_ids = list(wallet.load_snapshot(input).launcher_ids())
+        debug(f"Verifying {len(launcher_ids)} beacon coins from {input}")
+        stale, failures = await wallet.refresh_snapshot()
+        echo_failures(failures)
+        click.echo(
+            f"Loaded {len(launcher_ids)} beacon coins, caught up "
+            f"{stale - len(failures)} of {stale} stale ones"
+        )
+        if output:
+            _, failures = await wallet.export_snapshot(output, launcher_ids)
+            echo_failures(failures)
+            click.echo(f"Wrote caught up snapshot to {output}")
 
 
 cli.add_command(mint)
 cli.add_command(add_pair)
 cli.add_command(remove_pair_at)
+cli.add_command(replace_pair_at)
+cli.add_command(set_pair)
+cli.add_command(remove_key)
 cli.add_command(change_owner)
 cli.add_command(get_data)
 cli.add_command(freeze)
+cli.add_command(batch)
+cli.add_command(snapshot)
 
 if __name__ == "__main__":
     cli()
@@ -1,12 +1,29 @@
+import io
+from hashlib import sha256
 from pathlib import Path
 from pprint import pprint
+from typing import Dict, List, Tuple
 
 import cdv.clibs as std_lib
+from blspy import AugSchemeMPL, PrivateKey
 from cdv.util.load_clvm import load_clvm
+from chia.consensus.default_constants import DEFAULT_CONSTANTS
+from chia.types.blockchain_format.coin import Coin
 from chia.types.blockchain_format.program import Program
 from chia.types.blockchain_format.sized_bytes import bytes32
 from chia.types.coin_spend import CoinSpend
+from chia.types.spend_bundle import SpendBundle
+from chia.util.condition_tools import ConditionOpcode
+from chia.wallet.lineage_proof import LineageProof
+from chia.wallet.puzzles import (
+    p2_conditions,
+    p2_delegated_puzzle_or_hidden_puzzle,
+    singleton_top_layer,
+)
 from chia.wallet.puzzles.load_clvm import load_clvm as load_chia_clvm
+from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import (
+    calculate_synthetic_secret_key,
+)
 from clvm.SExp import SExp
 
 clibs_path: Path = Path(std_lib.__file__).parent
@@ -17,11 +34,83 @@ SINGLETON_LAUNCHER_HASH = LAUNCHER_PUZZLE.get_tree_hash()
 BEACON_MOD: Program = load_clvm(
     "beacon_puzzle.clsp", "beacon_coin.clsp", search_paths=[clibs_path]
 )
+# puzzle without REPLACE, REMOVE_KEY and UPSERT operators, beacons minted with
+# it stay on it for good
+BEACON_LEGACY_MOD: Program = load_clvm(
+    "beacon_puzzle_legacy.clsp", "beacon_coin.clsp", search_paths=[clibs_path]
+)
 
 SINGLETON_MOD_HASH = SINGLETON_MOD.get_tree_hash()
+BEACON_MOD_HASH = BEACON_MOD.get_tree_hash()
+BEACON_LEGACY_MOD_HASH = BEACON_LEGACY_MOD.get_tree_hash()
+BEACON_MODS: Dict[bytes32, Program] = {
+    BEACON_MOD_HASH: BEACON_MOD,
+    BEACON_LEGACY_MOD_HASH: BEACON_LEGACY_MOD,
+}
 COIN_AMOUNT = 1
 
 
+def _atom_hash(atom: bytes) -> bytes32:
+    return bytes32(sha256(b"\x01" + atom).digest())
+
+
+def _pair_hash(left: bytes32, right: bytes32) -> bytes32:
+    return bytes32(sha256(b"\x02" + left + right).digest())
+
+
+NULL_HASH = _atom_hash(b"")
+ONE_HASH = _atom_hash(b"\x01")
+Q_KW_HASH = ONE_HASH
+A_KW_HASH = _atom_hash(b"\x02")
+C_KW_HASH = _atom_hash(b"\x04")
+SINGLETON_MOD_HASH_HASH = _atom_hash(SINGLETON_MOD_HASH)
+SINGLETON_LAUNCHER_HASH_HASH = _atom_hash(SINGLETON_LAUNCHER_HASH)
+
+
+def curried_puzzle_hash(mod_hash: bytes32, *arg_hashes: bytes32) -> bytes32:
+    """Tree hash of `mod.curry(*args)` from tree hashes of mod and args.
+
+    Same as puzzle-hash-of-curried-function in curry_and_treehash.clib, so
+    puzzle hashes can be checked without building the curried puzzle."""
+    # (a (q . mod) (c (q . arg1) (c (q . arg2) ... 1)))
+    env_hash = ONE_HASH
+    for arg_hash in reversed(arg_hashes):
+        quoted_arg = _pair_hash(Q_KW_HASH, arg_hash)
+        env_hash = _pair_hash(
+            C_KW_HASH, _pair_hash(quoted_arg, _pair_hash(env_hash, NULL_HASH))
+        )
+    quoted_mod = _pair_hash(Q_KW_HASH, mod_hash)
+    return _pair_hash(
+        A_KW_HASH, _pair_hash(quoted_mod, _pair_hash(env_hash, NULL_HASH))
+    )
+
+
+def beacon_puzzle_hash(
+    data_hash: bytes32, version: int, pub_key: bytes, mod_hash=BEACON_MOD_HASH
+) -> bytes32:
+    """Puzzle hash of `create_beacon_puzzle` given tree hash of its data.
+
+    `mod_hash` is the MOD_HASH the beacon is curried with, it stays the same
+    for the whole lineage of a beacon."""
+    return curried_puzzle_hash(
+        mod_hash,
+        _atom_hash(mod_hash),
+        data_hash,
+        Program.to(version).get_tree_hash(),
+        Program.to(pub_key).get_tree_hash(),
+    )
+
+
+def singleton_puzzle_hash(launcher_id: bytes32, inner_puzzle_hash: bytes32) -> bytes32:
+    singleton_struct_hash = _pair_hash(
+        SINGLETON_MOD_HASH_HASH,
+        _pair_hash(_atom_hash(launcher_id), SINGLETON_LAUNCHER_HASH_HASH),
+    )
+    return curried_puzzle_hash(
+        SINGLETON_MOD_HASH, singleton_struct_hash, inner_puzzle_hash
+    )
+
+
 def singleton_puzzle(
     launcher_id: Program, launcher_puzzle_hash: bytes32, inner_puzzle: Program
 ) -> Program:
@@ -30,6 +119,13 @@ def singleton_puzzle(
     )
 
 
+def beacon_mod(mod_hash: bytes) -> Program:
+    try:
+        return BEACON_MODS[bytes32(mod_hash)]
+    except KeyError:
+        raise ValueError(f"Unknown beacon puzzle: {bytes(mod_hash).hex()}")
+
+
 def create_beacon_puzzle(data, pub_key, version=1, mod=BEACON_MOD) -> Program:
     return mod.curry(mod.get_tree_hash(), data, version, pub_key)
 
@@ -51,3 +147,142 @@ def solution_for_beacon(version, commit=None, new_pub_key=None, adapt=False) ->
     if not adapt:
         return Program.to([version, commit, new_pub_key or []])
     return Program.to([[], version, commit, new_pub_key or []])
+
+
+# Spend building below is CPU bound (currying, tree hashing, BLS signing) and
+# runs in an executor, possibly another process. Chia types don't pickle
+# (bytes32 can't be found by name), so coins, lineage proofs, hashes and spend
+# bundles are passed in and out serialized as plain bytes. Wallet keys are
+# registered once per process and looked up by their public key.
+_signing_keys: Dict[bytes, PrivateKey] = {}
+
+
+def register_key(sk: bytes):
+    """Makes a wallet key available to build_* functions in this process."""
+    key = PrivateKey.from_bytes(sk)
+    _signing_keys[bytes(key.get_g1())] = key
+
+
+def _signing_key(pub_key: bytes) -> PrivateKey:
+    try:
+        return _signing_keys[bytes(pub_key)]
+    except KeyError:
+        raise ValueError(f"No key registered for {bytes(pub_key).hex()}")
+
+
+def coin_to_bytes(coin: Coin) -> bytes:
+    # Coin refuses bytes(), it's ambiguous with the format it's hashed in
+    f = io.BytesIO()
+    coin.stream(f)
+    return f.getvalue()
+
+
+def _coin_from_bytes(blob: bytes) -> Coin:
+    return Coin.parse(io.BytesIO(blob))
+
+
+def tree_hash(value) -> bytes:
+    return bytes(Program.to(value).get_tree_hash())
+
+
+def build_beacon_spend(
+    launcher_id: bytes,
+    singleton: bytes,
+    lineage_proof: bytes,
+    state: Tuple[list, int, bytes],
+    new_version: int,
+    new_data: list,
+    commit=None,
+    new_pub_key=None,
+    mod_hash: bytes = BEACON_MOD_HASH,
+) -> Tuple[bytes, bytes]:
+    """Builds a signed spend of a beacon singleton.
+
+    `state` is data, version and owner key the singleton was created with,
+    owner key has to be registered. `mod_hash` picks the beacon puzzle it was
+    minted with. Returns spend bundle and tree hash of `new_data`."""
+    singleton = _coin_from_bytes(singleton)
+    lineage_proof = LineageProof.from_bytes(lineage_proof)
+    data, version, pub_key = state
+    puzzle = create_beacon_puzzle(
+        data, pub_key, version=version, mod=beacon_mod(mod_hash)
+    )
+    puzzle_reveal = singleton_top_layer.puzzle_for_singleton(
+        bytes32(launcher_id), puzzle
+    )
+    inner_solution = solution_for_beacon(new_version, commit, new_pub_key)
+    full_solution = singleton_top_layer.solution_for_singleton(
+        lineage_proof, singleton.amount, inner_solution
+    )
+    # the puzzle signs whatever the spend changes
+    if new_pub_key:
+        signed = new_pub_key
+    elif commit:
+        signed = commit
+    else:
+        signed = new_version
+    signature = AugSchemeMPL.sign(
+        _signing_key(pub_key),
+        (
+            Program.to(signed).get_tree_hash()
+            + singleton.name()
+            + DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
+        ),
+    )
+    spend_bundle = SpendBundle(
+        [CoinSpend(singleton, puzzle_reveal, full_solution)], signature
+    )
+    return bytes(spend_bundle), tree_hash(new_data)
+
+
+def _build_standard_spend(
+    pub_key: bytes, coin: Coin, conditions: List[Program], coin_spends: List[CoinSpend]
+) -> bytes:
+    wallet_sk = _signing_key(pub_key)
+    puzzle = p2_delegated_puzzle_or_hidden_puzzle.puzzle_for_pk(wallet_sk.get_g1())
+    solution = p2_delegated_puzzle_or_hidden_puzzle.solution_for_conditions(conditions)
+    delegated_puzzle = p2_conditions.puzzle_for_conditions(conditions)
+    ssk = calculate_synthetic_secret_key(
+        wallet_sk, p2_delegated_puzzle_or_hidden_puzzle.DEFAULT_HIDDEN_PUZZLE_HASH
+    )
+    signature = AugSchemeMPL.sign(
+        ssk,
+        (
+            delegated_puzzle.get_tree_hash()
+            + coin.name()
+            + DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
+        ),
+    )
+    spend_bundle = SpendBundle(
+        [CoinSpend(coin, puzzle, solution), *coin_spends], signature
+    )
+    return bytes(spend_bundle)
+
+
+def build_fee_spend(pub_key: bytes, coin: bytes, fee: int) -> bytes:
+    """Builds a spend of a standard wallet coin that leaves `fee` behind."""
+    coin = _coin_from_bytes(coin)
+    conditions = [
+        Program.to([ConditionOpcode.CREATE_COIN, coin.puzzle_hash, coin.amount - fee])
+    ]
+    return _build_standard_spend(pub_key, coin, conditions, [])
+
+
+def build_mint_spend(pub_key: bytes, coin: bytes, fee: int) -> bytes:
+    """Builds a spend of a standard wallet coin that launches a new beacon."""
+    coin = _coin_from_bytes(coin)
+    puzzle = create_beacon_puzzle([], pub_key)
+    conditions, launcher_coinsol = singleton_top_layer.launch_conditions_and_coinsol(
+        coin, puzzle, Program.to([]), COIN_AMOUNT
+    )
+    if COIN_AMOUNT < coin.amount:
+        conditions.append(
+            Program.to(
+                [
+                    ConditionOpcode.CREATE_COIN,
+                    coin.puzzle_hash,
+                    coin.amount - COIN_AMOUNT - fee,
+                ]
+            )
+        )
+    return _build_standard_spend(pub_key, coin, conditions, [launcher_coinsol])
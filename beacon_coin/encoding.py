@@ -0,0 +1,177 @@
+import zlib
+from typing import Any, Optional, Tuple
+
+from clvm.casts import int_from_bytes, int_to_bytes
+
+# Values are stored as CLVM atoms. Plain UTF-8 strings are kept as they are,
+# so existing coins decode unchanged, everything else is prefixed with a zero
+# byte followed by a flags byte and a tagged encoding of the value:
+#
+#   0x00 <flags> <tag> <payload>
+#
+# where payload of lists and dicts is a sequence of varint length prefixed
+# items and the whole <tag> <payload> part is zlib compressed if FLAG_ZLIB
+# is set.
+HEADER = b"\x00"
+FLAG_ZLIB = 1
+
+TAG_NONE = b"n"
+TAG_TRUE = b"t"
+TAG_FALSE = b"f"
+TAG_INT = b"i"
+TAG_BYTES = b"b"
+TAG_STR = b"s"
+TAG_LIST = b"l"
+TAG_DICT = b"d"
+
+# smaller values rarely compress enough to pay for zlib header
+COMPRESS_THRESHOLD = 128
+
+# dict keys have to decode to something hashable, lists and dicts don't
+KEY_TYPES = (type(None), bool, int, bytes, bytearray, str)
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(blob: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        byte = blob[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return n, pos
+        shift += 7
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return TAG_NONE
+    if value is True:
+        return TAG_TRUE
+    if value is False:
+        return TAG_FALSE
+    if isinstance(value, int):
+        return TAG_INT + int_to_bytes(value)
+    if isinstance(value, (bytes, bytearray)):
+        return TAG_BYTES + bytes(value)
+    if isinstance(value, str):
+        return TAG_STR + value.encode()
+    if isinstance(value, (list, tuple)):
+        # tuples are stored as lists and decode as such
+        items = [_encode(item) for item in value]
+        return TAG_LIST + b"".join(_varint(len(item)) + item for item in items)
+    if isinstance(value, dict):
+        for key in value:
+            if not isinstance(key, KEY_TYPES):
+                raise ValueError(f"Can't encode dict key of type {type(key).__name__}")
+        items = [_encode(item) for pair in value.items() for item in pair]
+        return TAG_DICT + b"".join(_varint(len(item)) + item for item in items)
+    raise ValueError(f"Can't encode value of type {type(value).__name__}")
+
+
+def _decode_items(blob: bytes) -> list:
+    items = []
+    pos = 0
+    while pos < len(blob):
+        length, pos = _read_varint(blob, pos)
+        items.append(_decode(blob[pos : pos + length]))
+        pos += length
+    return items
+
+
+def _decode(blob: bytes) -> Any:
+    tag, payload = blob[:1], blob[1:]
+    if tag == TAG_NONE:
+        return None
+    if tag == TAG_TRUE:
+        return True
+    if tag == TAG_FALSE:
+        return False
+    if tag == TAG_INT:
+        return int_from_bytes(payload)
+    if tag == TAG_BYTES:
+        return payload
+    if tag == TAG_STR:
+        return payload.decode()
+    if tag == TAG_LIST:
+        return _decode_items(payload)
+    if tag == TAG_DICT:
+        items = _decode_items(payload)
+        return dict(zip(items[::2], items[1::2]))
+    raise ValueError(f"Unknown value tag: {tag}")
+
+
+def encode_value(value: Any, compress_threshold: Optional[int] = None) -> bytes:
+    """Encodes a value for storing in coin data.
+
+    Encoded values of at least `compress_threshold` bytes are zlib compressed
+    if that makes them smaller, None disables compression. Tuples decode as
+    lists and dict keys can only be None, bools, ints, bytes or strings."""
+    if isinstance(value, str) and not value.startswith("\x00"):
+        plain = value.encode()
+    else:
+        plain = HEADER + bytes([0]) + _encode(value)
+    if compress_threshold is not None and len(plain) >= compress_threshold:
+        compressed = HEADER + bytes([FLAG_ZLIB]) + zlib.compress(_encode(value), 9)
+        if len(compressed) < len(plain):
+            return compressed
+    return plain
+
+
+def _unpack(raw: bytes) -> Optional[Tuple[int, bytes]]:
+    # flags and uncompressed <tag> <payload> of a value written by
+    # encode_value, None if it wasn't
+    if len(raw) < 3 or not raw.startswith(HEADER):
+        return None
+    flags, encoded = raw[1], raw[2:]
+    if flags & ~FLAG_ZLIB:
+        return None
+    if flags & FLAG_ZLIB:
+        try:
+            encoded = zlib.decompress(encoded)
+        except zlib.error:
+            return None
+    return flags, encoded
+
+
+def decode_value(raw: bytes) -> Any:
+    """Decodes a value stored in coin data.
+
+    Values not written by `encode_value` are returned as strings if they are
+    valid UTF-8, as bytes otherwise."""
+    unpacked = _unpack(raw)
+    if unpacked is not None:
+        try:
+            return _decode(unpacked[1])
+        except (IndexError, TypeError, ValueError):
+            # stored by something else and just happens to start with zero
+            pass
+    try:
+        return raw.decode()
+    except UnicodeDecodeError:
+        return raw
+
+
+def value_report(raw: bytes) -> dict:
+    """Returns how many bytes a stored value takes and how many compression saved."""
+    uncompressed = len(raw)
+    unpacked = _unpack(raw)
+    if unpacked is not None and unpacked[0] & FLAG_ZLIB:
+        # what encode_value would have stored with compression disabled
+        uncompressed = len(encode_value(decode_value(raw)))
+    return {
+        "stored": len(raw),
+        "uncompressed": uncompressed,
+        "saved": uncompressed - len(raw),
+    }
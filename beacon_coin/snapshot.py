@@ -0,0 +1,135 @@
+import mmap
+import os
+import struct
+import tempfile
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+from chia.types.blockchain_format.program import Program
+from chia.types.blockchain_format.sized_bytes import bytes32
+
+# Snapshot file layout, all integers big endian:
+#
+#   header: magic, format version, number of beacons
+#   index:  one fixed size entry per beacon, sorted by launcher id
+#   blobs:  serialized CLVM (owner data) per beacon, pointed to from the index
+#
+# The index can be binary searched straight from a memory map, so only the
+# beacons that are actually read get deserialized.
+MAGIC = b"BCNS"
+FORMAT_VERSION = 2
+HEADER = struct.Struct(">4sBI")
+# launcher id, tip coin id, beacon mod hash, height, version, blob offset,
+# blob length
+ENTRY = struct.Struct(">32s32s32sIIQI")
+
+
+@dataclass
+class BeaconState:
+    launcher_id: bytes32
+    coin_id: bytes32  # latest unspent singleton
+    height: int  # block the latest singleton was confirmed at
+    version: int
+    owner: bytes
+    data: list
+    mod_hash: bytes32  # beacon puzzle the singleton is curried with
+    # tree hash of data, computed when state is first verified
+    data_hash: Optional[bytes32] = field(default=None, compare=False, repr=False)
+
+
+def _serialize_blob(state: BeaconState) -> bytes:
+    return bytes(Program.to([state.owner, state.data]))
+
+
+def write_snapshot(path: str, states: List[BeaconState]):
+    """Writes states to `path`, replacing it only once the new file is complete.
+
+    The old file stays valid for readers that have it mapped."""
+    states = sorted(states, key=lambda state: state.launcher_id)
+    blobs = [_serialize_blob(state) for state in states]
+    offset = HEADER.size + ENTRY.size * len(states)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=".snapshot-"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(states)))
+            for state, blob in zip(states, blobs):
+                f.write(
+                    ENTRY.pack(
+                        state.launcher_id,
+                        state.coin_id,
+                        state.mod_hash,
+                        state.height,
+                        state.version,
+                        offset,
+                        len(blob),
+                    )
+                )
+                offset += len(blob)
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Snapshot:
+    """Read only, memory mapped view of a snapshot file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size:
+            raise ValueError(f"Not a beacon snapshot: {path}")
+        magic, format_version, self._count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a beacon snapshot: {path}")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {format_version}")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, i: int) -> tuple:
+        return ENTRY.unpack_from(self._mmap, HEADER.size + ENTRY.size * i)
+
+    def _launcher_id(self, i: int) -> bytes:
+        start = HEADER.size + ENTRY.size * i
+        return self._mmap[start : start + 32]
+
+    def _state(self, i: int) -> BeaconState:
+        launcher_id, coin_id, mod_hash, height, version, offset, length = self._entry(i)
+        payload = Program.from_bytes(self._mmap[offset : offset + length])
+        data = [pair.as_python() for pair in payload.rest().first().as_iter()]
+        return BeaconState(
+            bytes32(launcher_id),
+            bytes32(coin_id),
+            height,
+            version,
+            payload.first().atom,
+            data,
+            bytes32(mod_hash),
+        )
+
+    def launcher_ids(self) -> Iterator[bytes32]:
+        for i in range(self._count):
+            yield bytes32(self._launcher_id(i))
+
+    def get(self, launcher_id: bytes) -> Optional[BeaconState]:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._launcher_id(mid) < launcher_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._launcher_id(lo) == launcher_id:
+            return self._state(lo)
+        return None
+
+    def close(self):
+        self._mmap.close()
@@ -1,13 +1,22 @@
+import asyncio
 from contextlib import asynccontextmanager, contextmanager
 from enum import Enum
 from pprint import pprint
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import aiohttp
 
 from beacon_coin import driver
-from beacon_coin.driver import get_inner_puzzle_reveal, solution_for_beacon
-from blspy import AugSchemeMPL, G2Element, PrivateKey
+from beacon_coin.builder import SpendBuilder
+from beacon_coin.driver import get_inner_puzzle_reveal
+from beacon_coin.encoding import (
+    COMPRESS_THRESHOLD,
+    decode_value,
+    encode_value,
+    value_report,
+)
+from beacon_coin.snapshot import BeaconState, Snapshot, write_snapshot
+from blspy import PrivateKey
 from chia.consensus.coinbase import create_puzzlehash_for_pk
 from chia.consensus.default_constants import DEFAULT_CONSTANTS
 from chia.rpc.full_node_rpc_client import FullNodeRpcClient
@@ -15,12 +24,10 @@ from chia.rpc.wallet_rpc_client import WalletRpcClient
 from chia.types.blockchain_format.coin import Coin
 from chia.types.blockchain_format.program import INFINITE_COST, Program
 from chia.types.blockchain_format.sized_bytes import bytes32
-from chia.types.blockchain_format.tree_hash import sha256_treehash
 from chia.types.coin_record import CoinRecord
-from chia.types.coin_spend import CoinSpend
+from chia.types.mempool_inclusion_status import MempoolInclusionStatus
 from chia.types.spend_bundle import SpendBundle
 from chia.util.bech32m import decode_puzzle_hash, encode_puzzle_hash
-from chia.util.condition_tools import ConditionOpcode
 from chia.util.config import load_config
 from chia.util.default_root import DEFAULT_ROOT_PATH
 from chia.util.ints import uint16, uint32, uint64
@@ -28,24 +35,93 @@ from chia.wallet.derive_keys import (
     master_sk_to_wallet_sk,
 )
 from chia.wallet.lineage_proof import LineageProof
-from chia.wallet.puzzles import (
-    p2_conditions,
-    p2_delegated_puzzle_or_hidden_puzzle,
-    singleton_top_layer,
-)
-from chia.wallet.puzzles.p2_delegated_puzzle_or_hidden_puzzle import (
-    calculate_synthetic_secret_key,
-)
+from chia.wallet.puzzles import singleton_top_layer
 from chia.wallet.transaction_record import TransactionRecord
 from clvm.casts import int_from_bytes, int_to_bytes
 from clvm_tools.binutils import disassemble
 
 COIN_AMOUNT = 1
+# how many beacons are fetched at once when exporting or refreshing snapshots
+SNAPSHOT_CONCURRENCY = 32
+# how many snapshot tips are verified with a single coin records request
+SNAPSHOT_CHUNK = 500
+# seconds between checks for a new peak while transactions are awaited
+POLL_INTERVAL = 2
 
 
 class Operation(Enum):
     ADD = 16
     REMOVE = 17
+    REPLACE = 18
+    REMOVE_KEY = 19
+    UPSERT = 20
+
+
+# operators the legacy beacon puzzle understands
+LEGACY_OPERATIONS = (Operation.ADD, Operation.REMOVE)
+
+
+class TxStatus(Enum):
+    PENDING = "pending"
+    CONFIRMED = "confirmed"
+    EVICTED = "evicted"
+
+
+class TxNotConfirmed(ValueError):
+    def __init__(self, tx_id: bytes32, status: TxStatus):
+        super().__init__(f"Transaction {tx_id} was {status.value}")
+        self.tx_id = tx_id
+        self.status = status
+
+
+class CoinNotFound(Exception):
+    # not a ValueError, which stands for a beacon with no spends yet
+    def __init__(self, coin_id: bytes32):
+        super().__init__(f"Can't find coin: {coin_id.hex()}")
+        self.coin_id = coin_id
+
+
+def _apply_commit(data: list, op: int, args: list) -> list:
+    # replays a commit the same way mutate-data does in the puzzle
+    if op == Operation.ADD.value:
+        data.insert(0, args[0])
+    elif op == Operation.REMOVE.value:
+        index = int_from_bytes(args[0])
+        # remove-in-list-by-index ignores indexes that aren't in the list
+        if 0 <= index < len(data):
+            del data[index]
+    elif op == Operation.REPLACE.value:
+        index = int_from_bytes(args[0])
+        if not 0 <= index < len(data):
+            raise IndexError(f"Bad index: {index}")
+        data[index] = args[1]
+    elif op == Operation.REMOVE_KEY.value:
+        data[:] = [pair for pair in data if pair[0] != args[0]]
+    elif op == Operation.UPSERT.value:
+        for i, pair in enumerate(data):
+            if pair[0] == args[0][0]:
+                data[i] = args[0]
+                break
+        else:
+            data.insert(0, args[0])
+    else:
+        raise ValueError(f"Bad commit: {[op, *args]}")
+    return data
+
+
+def _failures(names: list, results: list) -> Dict[bytes32, BaseException]:
+    # pairs names with errors from asyncio.gather(..., return_exceptions=True)
+    return {
+        name: result
+        for name, result in zip(names, results)
+        if isinstance(result, BaseException)
+    }
+
+
+def _decode_pair(pair) -> tuple:
+    # a pair with an empty value is a one item list in CLVM
+    value = pair[1] if len(pair) > 1 else b""
+    return decode_value(pair[0]), decode_value(value)
 
 
 async def get_node_client(config_path=DEFAULT_ROOT_PATH) -> Optional[FullNodeRpcClient]:
@@ -91,6 +167,13 @@ async def get_wallet_client(config_path=DEFAULT_ROOT_PATH) -> Optional[WalletRpc
 
 
 class BeaconWallet:
+    """Manages beacon coins owned by a wallet key.
+
+    Safe to share between coroutines: spends of the same beacon are applied
+    one after another, each waiting for the previous one to be confirmed, and
+    wallet coins used for fees and minting are never picked by two spends at
+    once. Updates to many beacons can simply be run with `asyncio.gather`."""
+
     def __init__(
         self,
         wallet_id: str,
@@ -99,6 +182,8 @@ class BeaconWallet:
         wallet_address,
         private_key: PrivateKey,
         verbose=False,
+        compress_threshold: Optional[int] = COMPRESS_THRESHOLD,
+        workers: int = 0,
     ):
         self.wallet_client = wallet_client
         self.wallet_id = wallet_id
@@ -108,11 +193,47 @@ class BeaconWallet:
         self.sk = master_sk_to_wallet_sk(self.private_key, uint32(0))
         self.pk = self.sk.get_g1()
         self.verbose = verbose
+        # builds spends off the event loop, in a process pool if workers > 0
+        self.builder = SpendBuilder(bytes(self.sk), workers)
+        # values at least this long get compressed, None disables it
+        self.compress_threshold = compress_threshold
+        # launcher id -> latest known state, seeded from snapshot if loaded
+        self._states: Dict[bytes32, BeaconState] = {}
+        self._snapshot: Optional[Snapshot] = None
+        # launchers whose snapshot entry turned out wrong, walked from launcher
+        self._untrusted: Set[bytes32] = set()
+        # tx id -> coin id that will exist once the tx is confirmed
+        self._pending: Dict[bytes32, bytes32] = {}
+        # tx id -> state of the beacon once the tx is confirmed
+        self._pending_states: Dict[bytes32, BeaconState] = {}
+        self._settled: Dict[bytes32, TxStatus] = {}
+        # txs the node accepted as pending, it keeps them out of the mempool
+        # until they can get in, so missing from it doesn't mean evicted
+        self._held: Set[bytes32] = set()
+        # tx id -> peak height it was first seen missing from the mempool at
+        self._missing: Dict[bytes32, int] = {}
+        # a single watcher settles all pending transactions someone waits for
+        self.poll_interval = POLL_INTERVAL
+        self._tx_futures: Dict[bytes32, asyncio.Future] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        # launcher id -> last tx pushed for it, next spend has to wait for it
+        self._launcher_txs: Dict[bytes32, bytes32] = {}
+        self._launcher_locks: Dict[bytes32, asyncio.Lock] = {}
+        # wallet coins picked for spends that aren't confirmed yet
+        self._reserved_coins: Set[bytes32] = set()
+        self._tx_coins: Dict[bytes32, List[bytes32]] = {}
+        # set and cleared whenever reserved coins are given back
+        self._coins_released: Optional[asyncio.Event] = None
 
     @staticmethod
     @asynccontextmanager
     async def create(
-        fingerprint: int = None, config_file_path: str = None, verbose=False
+        fingerprint: int = None,
+        config_file_path: str = None,
+        verbose=False,
+        compress_threshold: Optional[int] = COMPRESS_THRESHOLD,
+        snapshot_path: str = None,
+        workers: int = 0,
     ):
         bw = None
         try:
@@ -150,7 +271,11 @@ class BeaconWallet:
                 wallet_address,
                 private_key,
                 verbose=verbose,
+                compress_threshold=compress_threshold,
+                workers=workers,
             )
+            if snapshot_path:
+                bw.load_snapshot(snapshot_path)
             if verbose:
                 print(f"Connected to wallet: {wallet_address}")
             yield bw
@@ -159,15 +284,29 @@ class BeaconWallet:
                 await bw.close()
 
     async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._snapshot is not None:
+            self._snapshot.close()
+        self.builder.shutdown()
         self.wallet_client.close()
         self.node_client.close()
         await self.wallet_client.await_closed()
         await self.node_client.await_closed()
 
     async def _mutate_data(
-        self, coin_name: bytes32, operation: Operation, value, fee=0
+        self, coin_name: bytes32, operation: Operation, args: list, fee=0, wait=False
     ) -> bytes32:
+        async with self._launcher_lock(coin_name):
+            tx_id = await self._mutate_data_locked(coin_name, operation, args, fee)
+        if wait:
+            await self._wait_confirmed(tx_id)
+        return tx_id
 
+    async def _mutate_data_locked(
+        self, coin_name: bytes32, operation: Operation, args: list, fee=0
+    ) -> bytes32:
+        await self._wait_for_launcher(coin_name)
         parent_record, singleton_record = await self._get_latest_singleton(coin_name)
 
         coin_spend = await self.node_client.get_puzzle_and_solution(
@@ -177,35 +316,43 @@ class BeaconWallet:
             coin_spend
         )
         singleton: Coin = singleton_record.coin
-        version, data = await self.get_data(coin_name)
+        version, data, mod_hash = await self._get_spend_base(coin_name, singleton)
+        if mod_hash != driver.BEACON_MOD_HASH and operation not in LEGACY_OPERATIONS:
+            raise ValueError(
+                f"{operation.name} isn't supported by the puzzle "
+                f"{coin_name.hex()} was minted with, only "
+                f"{', '.join(op.name for op in LEGACY_OPERATIONS)} are"
+            )
         if self.verbose:
             print(f"Mutating {version=} and {data=}")
-        puzzle = driver.create_beacon_puzzle(data, self.pk, version=version)
-        puzzle_reveal: Program = singleton_top_layer.puzzle_for_singleton(
-            coin_name,
-            puzzle,
-        )
+        if operation == Operation.REMOVE:
+            index = int_from_bytes(args[0])
+            if not 0 <= index < len(data):
+                # the puzzle would leave data as it is
+                raise IndexError(f"Bad index: {index}")
         new_version = version + 1
+        new_data = _apply_commit(list(data), operation.value, args)
+        commit = [operation.value, *args]
         if self.verbose:
-            print(f"Applying {new_version=} with {operation=} {value=}")
-        inner_solution = solution_for_beacon(new_version, [operation.value, value])
-        full_solution: Program = singleton_top_layer.solution_for_singleton(
-            lineage_proof, singleton.amount, inner_solution
-        )
-
-        signature: G2Element = AugSchemeMPL.sign(
-            self.sk,
-            (
-                sha256_treehash(Program.to([operation.value, value]))
-                + singleton.name()
-                + DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
-            ),
+            print(f"Applying {new_version=} with {operation=} {args=}")
+        singleton_spend, data_hash = await self._build_singleton_spend(
+            coin_name,
+            singleton,
+            lineage_proof,
+            (data, version, bytes(self.pk)),
+            new_version,
+            new_data,
+            commit=commit,
+            mod_hash=mod_hash,
         )
-        singleton_spend = SpendBundle(
-            [
-                CoinSpend(singleton, puzzle_reveal, full_solution),
-            ],
-            signature,
+        next_state = await self._next_state(
+            coin_name,
+            singleton,
+            new_data,
+            new_version,
+            bytes(self.pk),
+            mod_hash,
+            data_hash,
         )
         if fee > 0:
             fee_spend = await self._get_fee_spend_bundle(fee)
@@ -214,27 +361,72 @@ class BeaconWallet:
             singleton_spend.debug(
                 agg_sig_additional_data=DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
             )
-        result = await self.node_client.push_tx(singleton_spend)
-        if result and result.get("success"):
-            return singleton_spend.name()
-        singleton_spend.debug()
-        raise Exception("Error pushing transaction: %s" % singleton_spend.name())
+        return await self._push(singleton_spend, next_state)
 
     async def add_pair(
-        self, coin_name: bytes32, pair: Tuple[bytes, bytes], fee=0
+        self, coin_name: bytes32, pair: Tuple[Any, Any], fee=0, wait=False
     ) -> bool:
         if not isinstance(pair, (tuple, list)):
             raise ValueError("cons must be tuple or list")
         if len(pair) != 2:
             raise ValueError("Pairs must contain 2 items exactly")
-        return await self._mutate_data(coin_name, Operation.ADD, pair, fee=fee)
+        return await self._mutate_data(
+            coin_name, Operation.ADD, [self._encode_pair(*pair)], fee=fee, wait=wait
+        )
 
-    async def remove_pair_at(self, coin_name, index: int, fee=0) -> int:
+    async def remove_pair_at(self, coin_name, index: int, fee=0, wait=False) -> int:
+        if index < 0:
+            raise IndexError(f"Bad index: {index}")
         return await self._mutate_data(
-            coin_name, Operation.REMOVE, int_to_bytes(index), fee=fee
+            coin_name, Operation.REMOVE, [int_to_bytes(index)], fee=fee, wait=wait
         )
 
-    async def freeze(self, coin_name, fee=0) -> bool:
+    async def replace_pair_at(
+        self, coin_name, index: int, pair: Tuple[Any, Any], fee=0, wait=False
+    ) -> bytes32:
+        """Replaces pair at index in a single spend."""
+        return await self._mutate_data(
+            coin_name,
+            Operation.REPLACE,
+            [int_to_bytes(index), self._encode_pair(*pair)],
+            fee=fee,
+            wait=wait,
+        )
+
+    async def remove_key(self, coin_name, key, fee=0, wait=False) -> bytes32:
+        """Removes all pairs with given key."""
+        return await self._mutate_data(
+            coin_name, Operation.REMOVE_KEY, [encode_value(key)], fee=fee, wait=wait
+        )
+
+    async def set_pair(self, coin_name, key, value, fee=0, wait=False) -> bytes32:
+        """Replaces first pair with given key or prepends a new one if there's none.
+
+        Unlike removing and adding, this takes a single spend and doesn't depend
+        on index of the pair, so it can't be affected by other updates."""
+        return await self._mutate_data(
+            coin_name,
+            Operation.UPSERT,
+            [self._encode_pair(key, value)],
+            fee=fee,
+            wait=wait,
+        )
+
+    def _encode_pair(self, key, value) -> Tuple[bytes, bytes]:
+        pair = (encode_value(key), encode_value(value, self.compress_threshold))
+        if self.verbose:
+            print(f"Storing value as {value_report(pair[1])}")
+        return pair
+
+    async def freeze(self, coin_name, fee=0, wait=False) -> bool:
+        async with self._launcher_lock(coin_name):
+            tx_id = await self._freeze_locked(coin_name, fee)
+        if wait:
+            await self._wait_confirmed(tx_id)
+        return tx_id
+
+    async def _freeze_locked(self, coin_name, fee=0) -> bytes32:
+        await self._wait_for_launcher(coin_name)
         parent_record, singleton_record = await self._get_latest_singleton(coin_name)
 
         coin_spend = await self.node_client.get_puzzle_and_solution(
@@ -244,53 +436,117 @@ class BeaconWallet:
             coin_spend
         )
         singleton: Coin = singleton_record.coin
-        version, data = await self.get_data(coin_name)
-        puzzle = driver.create_beacon_puzzle(data, self.pk, version=version)
-        puzzle_reveal: Program = singleton_top_layer.puzzle_for_singleton(
-            coin_name,
-            puzzle,
-        )
+        version, data, mod_hash = await self._get_spend_base(coin_name, singleton)
         new_version = 0
-        inner_solution = solution_for_beacon(new_version)
-        full_solution: Program = singleton_top_layer.solution_for_singleton(
-            lineage_proof, singleton.amount, inner_solution
-        )
-
-        signature: G2Element = AugSchemeMPL.sign(
-            self.sk,
-            (
-                sha256_treehash(Program.to(new_version))
-                + singleton.name()
-                + DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
-            ),
+        singleton_spend, data_hash = await self._build_singleton_spend(
+            coin_name,
+            singleton,
+            lineage_proof,
+            (data, version, bytes(self.pk)),
+            new_version,
+            data,
+            mod_hash=mod_hash,
         )
-        singleton_spend = SpendBundle(
-            [
-                CoinSpend(singleton, puzzle_reveal, full_solution),
-            ],
-            signature,
+        next_state = await self._next_state(
+            coin_name, singleton, data, new_version, bytes(self.pk), mod_hash, data_hash
         )
         if fee > 0:
             fee_spend = await self._get_fee_spend_bundle(fee)
             singleton_spend = SpendBundle.aggregate([singleton_spend, fee_spend])
         if self.verbose:
             singleton_spend.debug()
-        result = await self.node_client.push_tx(singleton_spend)
-        if result and result.get("success"):
-            return singleton_spend.name()
-        raise Exception("Error pushing transaction: %s" % singleton_spend.name())
+        return await self._push(singleton_spend, next_state)
 
     async def get_data(self, coin_name) -> Tuple[int, list]:
+        version, data = await self._get_raw_data(coin_name)
+        return version, [_decode_pair(pair) for pair in data]
+
+    async def get_data_report(self, coin_name) -> List[dict]:
+        """Returns stored and uncompressed size of each value in coin data."""
+        _, data = await self._get_raw_data(coin_name)
+        return [value_report(pair[1] if len(pair) > 1 else b"") for pair in data]
+
+    async def _get_raw_data(self, coin_name) -> Tuple[int, list]:
+        version, data, _ = await self._get_spend_base(coin_name)
+        return version, data
+
+    async def _get_spend_base(
+        self, coin_name, singleton: Optional[Coin] = None
+    ) -> Tuple[int, list, bytes32]:
+        # version, data and beacon mod hash the next spend builds on
+        state = await self.get_state(coin_name)
+        if state is None:
+            return 1, [], self._fresh_mod_hash(coin_name, singleton)
+        return state.version, list(state.data), state.mod_hash
+
+    def _fresh_mod_hash(self, coin_name, singleton: Optional[Coin]) -> bytes32:
+        # a beacon that was never spent hasn't revealed its puzzle yet, so the
+        # mod it was minted with is matched by the singleton's puzzle hash
+        if singleton is not None:
+            data_hash = Program.to([]).get_tree_hash()
+            for mod_hash in driver.BEACON_MODS:
+                inner_puzzle_hash = driver.beacon_puzzle_hash(
+                    data_hash, 1, bytes(self.pk), mod_hash
+                )
+                puzzle_hash = driver.singleton_puzzle_hash(coin_name, inner_puzzle_hash)
+                if puzzle_hash == singleton.puzzle_hash:
+                    return mod_hash
+        return driver.BEACON_MOD_HASH
+
+    def _cached_state(self, coin_name) -> Optional[BeaconState]:
+        state = self._states.get(coin_name)
+        if (
+            state is None
+            and self._snapshot is not None
+            and coin_name not in self._untrusted
+        ):
+            state = self._snapshot.get(coin_name)
+            if state is not None:
+                self._states[coin_name] = state
+        return state
+
+    def _forget_state(self, coin_name):
+        # cached state is wrong, not just stale, lineage has to be walked
+        # from the launcher again
+        self._states.pop(coin_name, None)
+        self._untrusted.add(coin_name)
+
+    async def _cached_tip(
+        self, coin_name
+    ) -> Tuple[Optional[BeaconState], Optional[CoinRecord]]:
+        """Returns cached state of a beacon and coin record of its tip.
+
+        Cached state whose tip is missing or has a different puzzle hash than
+        the state describes is dropped and (None, None) returned."""
+        state = self._cached_state(coin_name)
+        if state is None:
+            return None, None
+        tip = await self.node_client.get_coin_record_by_name(state.coin_id)
+        if not await self._matches_tip(state, tip):
+            self._forget_state(coin_name)
+            return None, None
+        return state, tip
+
+    async def get_state(self, coin_name) -> Optional[BeaconState]:
+        """Returns latest state of a beacon, None if it has no spends yet.
+
+        Cached state is trusted after a single coin record lookup if its tip is
+        still unspent and the puzzle hash computed from the state matches the
+        tip's. If the tip is spent, lineage is only walked from it onwards, if
+        it doesn't match, from the launcher."""
+        state, tip = await self._cached_tip(coin_name)
+        if state is not None and not tip.spent:
+            return state
         try:
-            parent_record, _ = await self._get_latest_singleton(coin_name)
+            parent_record, tip_record = await self._get_latest_singleton(coin_name)
         except ValueError:
-            return 1, []
+            return None
         coin_spend = await self.node_client.get_puzzle_and_solution(
             parent_record.coin.name(), parent_record.spent_block_index
         )
         puzzle_reveal = get_inner_puzzle_reveal(coin_spend)
         if not puzzle_reveal:
-            return 1, []
+            return None
         solution_args = coin_spend.solution.to_program().rest().rest().first()
         commit = solution_args.rest().first().as_python()
         version = solution_args.first().as_python()
@@ -316,136 +572,230 @@ class BeaconWallet:
         else:
             data = data[1:]
         if commit:
-            op = int_from_bytes(commit[0])
             # manually apply last commit to data to
             # get latest version of data content
-            if op == Operation.ADD.value:
-                data.insert(0, commit[1])
-            elif op == Operation.REMOVE.value:
-                index = int_from_bytes(commit[1])
-                del data[index]
-            else:
-                raise ValueError(f"Bad commit: {commit}")
-        return version, data
+            data = _apply_commit(data, int_from_bytes(commit[0]), commit[1:])
+        # owner is either the new key from the last spend or the curried one
+        # the puzzle curries its own MOD_HASH into every next singleton
+        _, inner_args = puzzle_reveal.uncurry()
+        mod_hash = bytes32(inner_args.first().atom)
+        owner = solution_args.rest().rest().first().atom
+        if not owner:
+            owner = inner_args.rest().rest().rest().first().atom
+        state = BeaconState(
+            coin_name,
+            tip_record.coin.name(),
+            tip_record.confirmed_block_index,
+            version,
+            owner,
+            data,
+            mod_hash,
+        )
+        if tip_record.coin.puzzle_hash != await self._state_puzzle_hash(state):
+            raise ValueError(f"Replayed state of {coin_name.hex()} doesn't match chain")
+        self._states[coin_name] = state
+        return state
+
+    async def _matches_tip(self, state: BeaconState, tip: Optional[CoinRecord]) -> bool:
+        # cached state can be trusted if its tip exists and was created with
+        # the puzzle the state describes
+        if tip is None or tip.coin.puzzle_hash != await self._state_puzzle_hash(state):
+            if self.verbose:
+                print(
+                    f"Cached state of {state.launcher_id.hex()} doesn't match its tip"
+                )
+            return False
+        return True
 
-    async def _get_fee_spend_bundle(self, fee):
-        starting_coin = await self._find_usable_coin()
-        starting_puzzle: Program = p2_delegated_puzzle_or_hidden_puzzle.puzzle_for_pk(
-            self.pk
-        )  # noqa
-        conditions = []
-        conditions.append(
-            Program.to(
-                [
-                    ConditionOpcode.CREATE_COIN,
-                    starting_coin.puzzle_hash,
-                    starting_coin.amount - fee,
-                ]
+    async def _state_puzzle_hash(self, state: BeaconState) -> bytes32:
+        if state.data_hash is None:
+            state.data_hash = bytes32(
+                await self.builder.build(driver.tree_hash, state.data)
             )
+        inner_puzzle_hash = driver.beacon_puzzle_hash(
+            state.data_hash, state.version, state.owner, state.mod_hash
         )
-        full_solution: Program = (
-            p2_delegated_puzzle_or_hidden_puzzle.solution_for_conditions(conditions)
-        )  # noqa
+        return driver.singleton_puzzle_hash(state.launcher_id, inner_puzzle_hash)
 
-        starting_coinsol = CoinSpend(
-            starting_coin,
-            starting_puzzle,
-            full_solution,
-        )
-        delegated_puzzle: Program = p2_conditions.puzzle_for_conditions(conditions)
+    def load_snapshot(self, path: str) -> Snapshot:
+        """Seeds state cache from a snapshot file, see `export_snapshot`."""
+        if self._snapshot is not None:
+            self._snapshot.close()
+        self._snapshot = Snapshot(path)
+        self._states.clear()
+        self._untrusted.clear()
+        return self._snapshot
 
-        ssk = calculate_synthetic_secret_key(
-            self.sk, p2_delegated_puzzle_or_hidden_puzzle.DEFAULT_HIDDEN_PUZZLE_HASH
-        )
-        signature: G2Element = AugSchemeMPL.sign(
-            ssk,
-            (
-                delegated_puzzle.get_tree_hash()
-                + starting_coin.name()
-                + DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
-            ),
-        )
+    async def refresh_snapshot(
+        self, concurrency=SNAPSHOT_CONCURRENCY
+    ) -> Tuple[int, Dict[bytes32, BaseException]]:
+        """Verifies tips of all beacons in loaded snapshot and catches up stale
+        ones, returns how many were stale and errors of those that failed."""
+        if self._snapshot is None:
+            raise ValueError("No snapshot loaded")
+        launcher_ids = list(self._snapshot.launcher_ids())
+        stale = []
+        for i in range(0, len(launcher_ids), SNAPSHOT_CHUNK):
+            chunk = []
+            states = []
+            for name in launcher_ids[i : i + SNAPSHOT_CHUNK]:
+                state = self._cached_state(name)
+                if state is None:
+                    # entry was found wrong before and catching up failed
+                    stale.append(name)
+                else:
+                    chunk.append(name)
+                    states.append(state)
+            if not chunk:
+                continue
+            records = await self.node_client.get_coin_records_by_names(
+                [state.coin_id for state in states]
+            )
+            tips = {record.coin.name(): record for record in records}
+            matches = await asyncio.gather(
+                *[self._matches_tip(state, tips.get(state.coin_id)) for state in states]
+            )
+            for name, state, ok in zip(chunk, states, matches):
+                if not ok:
+                    self._forget_state(name)
+                if not ok or tips[state.coin_id].spent:
+                    stale.append(name)
+        semaphore = asyncio.Semaphore(concurrency)
 
-        spend_bundle = SpendBundle([starting_coinsol], signature)
-        return spend_bundle
+        async def catch_up(launcher_id):
+            async with semaphore:
+                await self.get_state(launcher_id)
 
-    async def _find_usable_coin(self) -> Coin:
-        puzzle_hash = decode_puzzle_hash(self.wallet_address)
-        unspent_coin_records: List[
-            CoinRecord
-        ] = await self.node_client.get_coin_records_by_puzzle_hash(
-            puzzle_hash, include_spent_coins=False
+        results = await asyncio.gather(
+            *[catch_up(name) for name in stale], return_exceptions=True
         )
+        return len(stale), _failures(stale, results)
 
-        coin_record: CoinRecord
-        for coin_record in unspent_coin_records:
-            coin: Coin = coin_record.coin
-            if coin.amount > 0 and not coin_record.spent:
-                return coin
-        raise ValueError("No usable coins found in the wallet. Pick another.")
-
-    async def mint(self, fee=0) -> Tuple[bytes32, bytes32]:
-        puzzle = driver.create_beacon_puzzle([], self.pk)
-        starting_coin = await self._find_usable_coin()
-        starting_puzzle: Program = p2_delegated_puzzle_or_hidden_puzzle.puzzle_for_pk(
-            self.pk
-        )  # noqa
-        (
-            conditions,
-            launcher_coinsol,
-        ) = singleton_top_layer.launch_conditions_and_coinsol(  # noqa
-            starting_coin, puzzle, Program.to([]), COIN_AMOUNT
+    async def export_snapshot(
+        self, path: str, coin_names: List[bytes32], concurrency=SNAPSHOT_CONCURRENCY
+    ) -> Tuple[List[BeaconState], Dict[bytes32, BaseException]]:
+        """Writes latest state of given beacons to a snapshot file.
+
+        Beacons with no spends yet (reading them is as fast without a snapshot)
+        and those whose state can't be read are left out, returns written
+        states and why the others were left out."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(coin_name):
+            async with semaphore:
+                state = await self.get_state(coin_name)
+            if state is None:
+                raise ValueError("Beacon has no spends yet")
+            return state
+
+        results = await asyncio.gather(
+            *[fetch(name) for name in coin_names], return_exceptions=True
         )
-        if COIN_AMOUNT < starting_coin.amount:
-            conditions.append(
-                Program.to(
-                    [
-                        ConditionOpcode.CREATE_COIN,
-                        starting_coin.puzzle_hash,
-                        starting_coin.amount - COIN_AMOUNT - fee,
-                    ]
-                )
+        states = [state for state in results if isinstance(state, BeaconState)]
+        write_snapshot(path, states)
+        return states, _failures(coin_names, results)
+
+    async def _get_fee_spend_bundle(self, fee) -> SpendBundle:
+        starting_coin = await self._find_usable_coin(fee)
+        try:
+            spend_bundle = await self.builder.build(
+                driver.build_fee_spend,
+                bytes(self.pk),
+                driver.coin_to_bytes(starting_coin),
+                fee,
             )
-        full_solution: Program = (
-            p2_delegated_puzzle_or_hidden_puzzle.solution_for_conditions(conditions)
-        )  # noqa
+            return SpendBundle.from_bytes(spend_bundle)
+        except BaseException:
+            self._release_coins([starting_coin.name()])
+            raise
 
-        starting_coinsol = CoinSpend(
-            starting_coin,
-            starting_puzzle,
-            full_solution,
-        )
-        delegated_puzzle: Program = p2_conditions.puzzle_for_conditions(conditions)
+    async def _find_usable_coin(self, min_amount=1) -> Coin:
+        """Picks and reserves a wallet coin worth at least `min_amount`.
 
-        ssk = calculate_synthetic_secret_key(
-            self.sk, p2_delegated_puzzle_or_hidden_puzzle.DEFAULT_HIDDEN_PUZZLE_HASH
-        )
-        signature: G2Element = AugSchemeMPL.sign(
-            ssk,
-            (
-                delegated_puzzle.get_tree_hash()
-                + starting_coin.name()
-                + DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
-            ),
-        )
+        If all of them are reserved, waits for a spend holding one to settle
+        and give back the coin or its change."""
+        puzzle_hash = decode_puzzle_hash(self.wallet_address)
+        while True:
+            unspent_coin_records: List[
+                CoinRecord
+            ] = await self.node_client.get_coin_records_by_puzzle_hash(
+                puzzle_hash, include_spent_coins=False
+            )
+
+            coin_record: CoinRecord
+            for coin_record in unspent_coin_records:
+                coin: Coin = coin_record.coin
+                if coin.name() in self._reserved_coins:
+                    # already used by another spend that's not confirmed yet
+                    continue
+                if coin.amount >= min_amount and not coin_record.spent:
+                    self._reserved_coins.add(coin.name())
+                    return coin
+            if not self._reserved_coins:
+                raise ValueError("No usable coins found in the wallet. Pick another.")
+            await self._wait_for_coins()
+
+    async def _wait_for_coins(self):
+        # coins are either held by pushed transactions, whose change will be
+        # usable once they're confirmed, or by spends still being built
+        if self._coins_released is None:
+            self._coins_released = asyncio.Event()
+        holders = [tx_id for tx_id, coins in self._tx_coins.items() if coins]
+        waits = [self._tx_future(tx_id) for tx_id in holders]
+        released = asyncio.ensure_future(self._coins_released.wait())
+        try:
+            await asyncio.wait([*waits, released], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            released.cancel()
+
+    def _release_coins(self, names: List[bytes32]):
+        self._reserved_coins.difference_update(names)
+        if self._coins_released is not None:
+            # wakes up everyone waiting at the moment
+            self._coins_released.set()
+            self._coins_released.clear()
 
-        spend_bundle = SpendBundle([starting_coinsol, launcher_coinsol], signature)
+    async def mint(self, fee=0, wait=False) -> Tuple[bytes32, bytes32]:
+        starting_coin = await self._find_usable_coin(COIN_AMOUNT + fee)
+        try:
+            spend_bundle = SpendBundle.from_bytes(
+                await self.builder.build(
+                    driver.build_mint_spend,
+                    bytes(self.pk),
+                    driver.coin_to_bytes(starting_coin),
+                    fee,
+                )
+            )
+        except BaseException:
+            self._release_coins([starting_coin.name()])
+            raise
         if self.verbose:
             spend_bundle.debug(
                 agg_sig_additional_data=DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
             )
-        # assert False
-        # assert False
-        resp = await self.node_client.push_tx(spend_bundle)
-        if not resp["success"]:
-            raise ValueError("Couldn't push the transaction: %s" % resp)
         launcher_coin: Coin = singleton_top_layer.generate_launcher_coin(
             starting_coin,
             uint64(COIN_AMOUNT),
         )
-        return spend_bundle.name(), launcher_coin.name()
+        # launcher is created and spent in the same block
+        tx_id = await self._push(spend_bundle, coin_id=launcher_coin.name())
+        if wait:
+            await self._wait_confirmed(tx_id)
+        return tx_id, launcher_coin.name()
+
+    async def set_ownership(
+        self, coin_name, new_pub_key: bytes32, fee=0, wait=False
+    ) -> bool:
+        async with self._launcher_lock(coin_name):
+            tx_id = await self._set_ownership_locked(coin_name, new_pub_key, fee)
+        if wait:
+            await self._wait_confirmed(tx_id)
+        return tx_id
 
-    async def set_ownership(self, coin_name, new_pub_key: bytes32, fee=0) -> bool:
+    async def _set_ownership_locked(
+        self, coin_name, new_pub_key: bytes32, fee=0
+    ) -> bytes32:
+        await self._wait_for_launcher(coin_name)
         parent_record, singleton_record = await self._get_latest_singleton(coin_name)
 
         coin_spend = await self.node_client.get_puzzle_and_solution(
@@ -455,56 +805,234 @@ class BeaconWallet:
             coin_spend
         )
         singleton: Coin = singleton_record.coin
-        version, data = await self.get_data(coin_name)
-        puzzle = driver.create_beacon_puzzle(data, self.pk, version=version)
-        puzzle_reveal: Program = singleton_top_layer.puzzle_for_singleton(
+        version, data, mod_hash = await self._get_spend_base(coin_name, singleton)
+        singleton_spend, data_hash = await self._build_singleton_spend(
             coin_name,
-            puzzle,
+            singleton,
+            lineage_proof,
+            (data, version, bytes(self.pk)),
+            version,
+            data,
+            new_pub_key=new_pub_key,
+            mod_hash=mod_hash,
         )
-        inner_solution = solution_for_beacon(version, new_pub_key=new_pub_key)
-        full_solution: Program = singleton_top_layer.solution_for_singleton(
-            lineage_proof, singleton.amount, inner_solution
-        )
-
-        signature: G2Element = AugSchemeMPL.sign(
-            self.sk,
-            (
-                sha256_treehash(Program.to(new_pub_key))
-                + singleton.name()
-                + DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA
-            ),
-        )
-        singleton_spend = SpendBundle(
-            [
-                CoinSpend(singleton, puzzle_reveal, full_solution),
-            ],
-            signature,
+        owner = Program.to(new_pub_key).atom
+        next_state = await self._next_state(
+            coin_name, singleton, data, version, owner, mod_hash, data_hash
         )
         if fee > 0:
             fee_spend = await self._get_fee_spend_bundle(fee)
             singleton_spend = SpendBundle.aggregate([singleton_spend, fee_spend])
         if self.verbose:
             singleton_spend.debug()
-        result = await self.node_client.push_tx(singleton_spend)
-        if result and result.get("success"):
-            return singleton_spend.name()
-        raise Exception("Error pushing transaction: %s" % singleton_spend.name())
+        return await self._push(singleton_spend, next_state)
+
+    async def _build_singleton_spend(
+        self,
+        coin_name,
+        singleton: Coin,
+        lineage_proof: LineageProof,
+        state: Tuple[list, int, bytes],
+        new_version: int,
+        new_data: list,
+        commit=None,
+        new_pub_key=None,
+        mod_hash: bytes32 = driver.BEACON_MOD_HASH,
+    ) -> Tuple[SpendBundle, bytes32]:
+        spend_bundle, data_hash = await self.builder.build(
+            driver.build_beacon_spend,
+            bytes(coin_name),
+            driver.coin_to_bytes(singleton),
+            bytes(lineage_proof),
+            state,
+            new_version,
+            new_data,
+            commit,
+            new_pub_key,
+            bytes(mod_hash),
+        )
+        return SpendBundle.from_bytes(spend_bundle), bytes32(data_hash)
+
+    async def _next_state(
+        self,
+        coin_name,
+        singleton: Coin,
+        data,
+        version,
+        owner: bytes,
+        mod_hash: bytes32,
+        data_hash=None,
+    ) -> BeaconState:
+        # coin id and height are filled in below and once confirmed
+        state = BeaconState(
+            coin_name, None, 0, version, owner, data, mod_hash, data_hash
+        )
+        puzzle_hash = await self._state_puzzle_hash(state)
+        state.coin_id = Coin(singleton.name(), puzzle_hash, singleton.amount).name()
+        return state
+
+    def _launcher_lock(self, coin_name) -> asyncio.Lock:
+        if coin_name not in self._launcher_locks:
+            self._launcher_locks[coin_name] = asyncio.Lock()
+        return self._launcher_locks[coin_name]
+
+    async def _wait_for_launcher(self, coin_name):
+        # a singleton can only be spent once it's confirmed, so the next
+        # spend has to build on the result of the previous one
+        tx_id = self._launcher_txs.get(coin_name)
+        if tx_id is not None:
+            if self.verbose:
+                print(f"Waiting for {tx_id} before spending {coin_name.hex()}")
+            await self.wait_for_confirmation([tx_id])
+
+    async def _push(
+        self, spend_bundle: SpendBundle, new_state: BeaconState = None, coin_id=None
+    ) -> bytes32:
+        tx_id = spend_bundle.name()
+        spent = [coin.name() for coin in spend_bundle.removals()]
+        try:
+            result = await self.node_client.push_tx(spend_bundle)
+            if not (result and result.get("success")):
+                raise Exception("Error pushing transaction: %s" % tx_id)
+            if result.get("status") == MempoolInclusionStatus.PENDING.name:
+                self._held.add(tx_id)
+        except Exception:
+            if self.verbose:
+                spend_bundle.debug()
+            self._release_coins(spent)
+            raise
+        self._tx_coins[tx_id] = [name for name in spent if name in self._reserved_coins]
+        if new_state is not None:
+            coin_id = new_state.coin_id
+            self._pending_states[tx_id] = new_state
+            self._launcher_txs[new_state.launcher_id] = tx_id
+        self._pending[tx_id] = coin_id
+        return tx_id
+
+    def _settle(self, tx_id: bytes32, status: TxStatus, height=0):
+        self._settled[tx_id] = status
+        del self._pending[tx_id]
+        self._held.discard(tx_id)
+        self._missing.pop(tx_id, None)
+        self._release_coins(self._tx_coins.pop(tx_id, []))
+        future = self._tx_futures.pop(tx_id, None)
+        if future is not None and not future.done():
+            future.set_result(status)
+        state = self._pending_states.pop(tx_id, None)
+        if state is None:
+            return
+        if self._launcher_txs.get(state.launcher_id) == tx_id:
+            del self._launcher_txs[state.launcher_id]
+        if status == TxStatus.CONFIRMED:
+            state.height = height
+            self._states[state.launcher_id] = state
+
+    async def wait_for_confirmation(
+        self, tx_ids: List[bytes32], timeout: float = None
+    ) -> Dict[bytes32, TxStatus]:
+        """Waits for transactions pushed by this wallet to be confirmed.
+
+        All waiters share one watcher, which looks up expected coins of every
+        awaited transaction in a single request per new peak, so any number
+        of them can be awaited at once. Transactions still unconfirmed after
+        `timeout` seconds are PENDING."""
+        results: Dict[bytes32, TxStatus] = {}
+        futures: Dict[bytes32, asyncio.Future] = {}
+        for tx_id in tx_ids:
+            if tx_id in self._settled:
+                results[tx_id] = self._settled[tx_id]
+            elif tx_id in self._pending:
+                futures[tx_id] = self._tx_future(tx_id)
+            else:
+                raise ValueError(f"Unknown transaction: {tx_id}")
+        if not futures:
+            return results
+        # shielded by asyncio.wait, a timeout doesn't cancel shared futures
+        await asyncio.wait(list(futures.values()), timeout=timeout)
+        for tx_id, future in futures.items():
+            results[tx_id] = future.result() if future.done() else TxStatus.PENDING
+        return results
+
+    def _tx_future(self, tx_id: bytes32) -> asyncio.Future:
+        # resolves to status of a pending transaction once it's settled
+        if tx_id not in self._tx_futures:
+            self._tx_futures[tx_id] = asyncio.get_running_loop().create_future()
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.ensure_future(self._watch())
+        return self._tx_futures[tx_id]
+
+    async def _watch(self):
+        last_height = None
+        try:
+            while self._tx_futures:
+                state = await self.node_client.get_blockchain_state()
+                peak = state["peak"]
+                if peak is not None and peak.height != last_height:
+                    last_height = peak.height
+                    await self._check_pending(peak.height)
+                if self._tx_futures:
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            # waiters get the error, next wait starts a new watcher
+            for future in self._tx_futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            self._tx_futures.clear()
+
+    async def _check_pending(self, height: int):
+        awaited = {tx_id: self._pending[tx_id] for tx_id in self._tx_futures}
+        # check mempool before coins, otherwise a tx that lands in between
+        # would look evicted
+        in_mempool = set(await self.node_client.get_all_mempool_tx_ids())
+        records = await self.node_client.get_coin_records_by_names(
+            list(awaited.values())
+        )
+        confirmed = {record.coin.name(): record for record in records}
+        for tx_id, coin_id in awaited.items():
+            if coin_id in confirmed:
+                status = TxStatus.CONFIRMED
+                self._settle(tx_id, status, confirmed[coin_id].confirmed_block_index)
+            elif tx_id in in_mempool:
+                self._held.discard(tx_id)
+                self._missing.pop(tx_id, None)
+                continue
+            elif tx_id in self._held:
+                continue
+            elif self._missing.setdefault(tx_id, height) == height:
+                # mempool is rebuilt on every new peak and a tx can be missing
+                # from it meanwhile, so it only counts as evicted at the next one
+                continue
+            else:
+                status = TxStatus.EVICTED
+                self._settle(tx_id, status)
+            if self.verbose:
+                print(f"Transaction {tx_id} {status.value} at {height}")
+
+    async def _wait_confirmed(self, tx_id: bytes32):
+        status = (await self.wait_for_confirmation([tx_id]))[tx_id]
+        if status != TxStatus.CONFIRMED:
+            raise TxNotConfirmed(tx_id, status)
 
     async def _get_latest_singleton(
         self, coin_id: bytes32
     ) -> Tuple[CoinRecord, CoinRecord]:
         if self.verbose:
             print(f"Finding latest singleton for launcher: {coin_id.hex()}")
-        coin_record: CoinRecord = await self.node_client.get_coin_record_by_name(
-            coin_id
-        )
+        state, coin_record = await self._cached_tip(coin_id)
+        if state is not None:
+            # no need to walk the lineage before the cached tip
+            coin_id = state.coin_id
+        else:
+            coin_record = await self.node_client.get_coin_record_by_name(coin_id)
 
         if not coin_record:
-            raise Exception(f"Can't find coin: {coin_id.hex()}")
+            raise CoinNotFound(coin_id)
         if not coin_record.spent:
             # fresh beacon coin, return now
             return (
-                await self.node_client.get_coin_record_by_name(coin_record.parent_info),
+                await self.node_client.get_coin_record_by_name(
+                    coin_record.coin.parent_coin_info
+                ),
                 coin_record,
             )
         while True:
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Measures how many beacon spends per second SpendBuilder builds and signs.
+
+Uses random keys and made up coins, so it needs no node or wallet:
+
+    python benchmarks/spend_building.py --spends 500 --workers 0 1 2 4 8
+
+Besides throughput it reports the longest the event loop went without running
+a callback while spends were built, which is what in-flight RPCs would see.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from blspy import AugSchemeMPL, PrivateKey
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.util.ints import uint64
+from chia.wallet.lineage_proof import LineageProof
+
+from beacon_coin import driver
+from beacon_coin.builder import SpendBuilder
+from beacon_coin.wallet import Operation
+
+TICK = 0.01
+
+
+def _jobs(pub_key: bytes, spends: int, pairs: int) -> list:
+    data = [[f"key-{i}".encode(), os.urandom(32)] for i in range(pairs)]
+    jobs = []
+    for _ in range(spends):
+        launcher_id = os.urandom(32)
+        singleton = Coin(
+            bytes32(os.urandom(32)), bytes32(os.urandom(32)), uint64(driver.COIN_AMOUNT)
+        )
+        lineage_proof = LineageProof(
+            bytes32(os.urandom(32)), bytes32(os.urandom(32)), uint64(1)
+        )
+        pair = [b"new", os.urandom(32)]
+        jobs.append(
+            (
+                launcher_id,
+                driver.coin_to_bytes(singleton),
+                bytes(lineage_proof),
+                (data, 1, pub_key),
+                2,
+                [pair] + data,
+                [Operation.ADD.value, pair],
+            )
+        )
+    return jobs
+
+
+async def _build_all(builder: SpendBuilder, jobs: list) -> tuple:
+    loop = asyncio.get_running_loop()
+    max_stall = 0.0
+
+    async def ticker():
+        # wakes up every TICK, anything later than that is time the loop was busy
+        nonlocal max_stall
+        while True:
+            tick = loop.time()
+            await asyncio.sleep(TICK)
+            max_stall = max(max_stall, loop.time() - tick - TICK)
+
+    ticking = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[builder.build(driver.build_beacon_spend, *job) for job in jobs]
+    )
+    elapsed = time.perf_counter() - start
+    ticking.cancel()
+    return elapsed, max_stall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spends", type=int, default=500)
+    parser.add_argument("--pairs", type=int, default=10, help="Pairs per beacon.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[0, 1, 2, 4, os.cpu_count()],
+        help="Process counts to try, 0 builds in a thread.",
+    )
+    args = parser.parse_args()
+    sk = bytes(AugSchemeMPL.key_gen(os.urandom(32)))
+    jobs = _jobs(bytes(PrivateKey.from_bytes(sk).get_g1()), args.spends, args.pairs)
+    print(f"{'workers':>8} {'seconds':>8} {'spends/s':>9} {'max stall ms':>13}")
+    for workers in args.workers:
+        builder = SpendBuilder(sk, workers)
+        try:
+            # first round starts up the pool and loads puzzles in workers
+            asyncio.run(_build_all(builder, jobs[: max(workers, 1)]))
+            elapsed, max_stall = asyncio.run(_build_all(builder, jobs))
+        finally:
+            builder.shutdown()
+        print(
+            f"{workers:>8} {elapsed:>8.2f} {len(jobs) / elapsed:>9.1f}"
+            f" {max_stall * 1000:>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
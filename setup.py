@@ -10,6 +10,8 @@ dependencies = [
 ]
 
 dev_dependencies = [
+    "pytest",
+    "pytest-asyncio",
     "flake8",
     "mypy",
     "black",
@@ -0,0 +1,110 @@
+import asyncio
+from collections import Counter
+
+import pytest
+from blspy import AugSchemeMPL
+from chia.clvm.spend_sim import SimClient, SpendSim
+from chia.consensus.coinbase import create_puzzlehash_for_pk
+from chia.types.mempool_inclusion_status import MempoolInclusionStatus
+from chia.util.bech32m import encode_puzzle_hash
+from chia.util.ints import uint32
+from chia.wallet.derive_keys import master_sk_to_wallet_sk
+
+from beacon_coin.wallet import BeaconWallet
+
+# seconds between blocks farmed by the `farmer` fixture
+BLOCK_TIME = 0.2
+
+
+class Peak:
+    def __init__(self, height: int):
+        self.height = height
+
+
+class SimNode(SimClient):
+    """Full node RPC client API the wallet uses, on top of chia's spend
+    simulator. Counts calls, so tests can check how many RPCs were made."""
+
+    def __init__(self, sim: SpendSim):
+        super().__init__(sim)
+        self.calls = Counter()
+
+    def __getattribute__(self, name):
+        if not name.startswith("_") and name not in ("calls", "service"):
+            self.calls[name] += 1
+        return super().__getattribute__(name)
+
+    async def get_blockchain_state(self) -> dict:
+        return {"peak": Peak(self.service.get_height())}
+
+    async def push_tx(self, spend_bundle) -> dict:
+        status, error = await super().push_tx(spend_bundle)
+        if status == MempoolInclusionStatus.FAILED:
+            # same as the RPC client, which raises on failed requests
+            raise ValueError(f"Failed to push {spend_bundle.name()}: {error}")
+        return {"success": True, "status": status.name}
+
+    async def get_coin_records_by_names(self, names, include_spent_coins=True):
+        coin_store = self.service.mempool_manager.coin_store
+        return await coin_store.get_coin_records_by_names(include_spent_coins, names)
+
+    async def get_coin_records_by_parent_ids(
+        self, parent_ids, include_spent_coins=True
+    ):
+        coin_store = self.service.mempool_manager.coin_store
+        return await coin_store.get_coin_records_by_parent_ids(
+            include_spent_coins, parent_ids
+        )
+
+    def evict(self, tx_id):
+        mempool = self.service.mempool_manager.mempool
+        mempool.remove_from_pool(mempool.spends[tx_id])
+
+    def close(self):
+        pass
+
+    async def await_closed(self):
+        pass
+
+
+@pytest.fixture
+async def sim():
+    sim = await SpendSim.create()
+    yield sim
+    await sim.close()
+
+
+@pytest.fixture
+async def node(sim):
+    return SimNode(sim)
+
+
+@pytest.fixture
+async def wallet(sim, node):
+    """Wallet with two farmed blocks worth of coins, which are four coins."""
+    private_key = AugSchemeMPL.key_gen(b"\x01" * 32)
+    puzzle_hash = create_puzzlehash_for_pk(
+        master_sk_to_wallet_sk(private_key, uint32(0)).get_g1()
+    )
+    for _ in range(2):
+        await sim.farm_block(puzzle_hash)
+    wallet = BeaconWallet(
+        1, node, node, encode_puzzle_hash(puzzle_hash, "txch"), private_key
+    )
+    wallet.poll_interval = BLOCK_TIME / 4
+    yield wallet
+    await wallet.close()
+
+
+@pytest.fixture
+async def farmer(sim):
+    """Farms a block every BLOCK_TIME seconds."""
+
+    async def farm():
+        while True:
+            await asyncio.sleep(BLOCK_TIME)
+            await sim.farm_block()
+
+    task = asyncio.ensure_future(farm())
+    yield
+    task.cancel()
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import pytest
+
+from beacon_coin.batch import parse_operation, run_batch
+
+LAUNCHER_ID = "0x" + "ab" * 32
+
+
+def line(**operation) -> str:
+    return json.dumps(operation)
+
+
+@pytest.mark.parametrize(
+    "operation, error",
+    [
+        ({"op": "nope"}, "Unknown op"),
+        ({"op": "get-data", "launcher_id": "ab" * 33}, "must start with 0x"),
+        ({"op": "get-data", "launcher_id": "0x" + "zz" * 32}, "not valid hex"),
+        ({"op": "get-data", "launcher_id": LAUNCHER_ID[:-2]}, "66 chars"),
+        ({"op": "mint", "fee": "10"}, "fee"),
+        ({"op": "mint", "fee": None}, "fee"),
+        ({"op": "mint", "fee": -1}, "fee"),
+        ({"op": "mint", "fee": True}, "fee"),
+        ({"op": "add-pair", "launcher_id": LAUNCHER_ID, "key": "k"}, "needs value"),
+        ({"op": "remove-pair", "launcher_id": LAUNCHER_ID}, "needs index"),
+        ({"op": "remove-pair", "launcher_id": LAUNCHER_ID, "index": "1"}, "index"),
+        ({"op": "remove-key", "launcher_id": LAUNCHER_ID}, "needs key"),
+        ({"op": "change-owner", "launcher_id": LAUNCHER_ID}, "needs new_pub_key"),
+    ],
+)
+def test_parse_errors(operation, error):
+    with pytest.raises(ValueError, match=error):
+        parse_operation(json.dumps(operation))
+
+
+def test_parse():
+    operation = parse_operation(
+        line(op="replace-pair", launcher_id=LAUNCHER_ID, index=0, key="k", value=1)
+    )
+    assert operation["launcher_id"] == bytes.fromhex("ab" * 32)
+
+
+class Wallet:
+    async def get_data(self, launcher_id):
+        return 1, [("k", "v")]
+
+
+@pytest.mark.asyncio
+async def test_one_result_per_line():
+    lines = [
+        line(id=1, op="mint", fee="10"),
+        "not json",
+        line(id=3, op="get-data", launcher_id=LAUNCHER_ID),
+        line(id=4, op="add-pair", launcher_id=LAUNCHER_ID, key="k", fee=None),
+    ]
+    results = [result async for result in run_batch(Wallet(), lines)]
+    assert len(results) == 4
+    assert "fee" in results[0]["error"]
+    assert "error" in results[1]
+    assert results[2] == {
+        "id": 3,
+        "op": "get-data",
+        "version": 1,
+        "data": [(0, ("k", "v"))],
+    }
+    assert "error" in results[3]
+
+
+class RecordingWallet:
+    """Records calls, writes to launchers in `blocked` wait until released."""
+
+    def __init__(self, *blocked):
+        self.calls = []
+        self.blocked = {launcher_id: asyncio.Event() for launcher_id in blocked}
+        self.reading = self.max_reading = 0
+
+    async def get_data(self, launcher_id):
+        self.reading += 1
+        self.max_reading = max(self.max_reading, self.reading)
+        await asyncio.sleep(0.01)
+        self.reading -= 1
+        self.calls.append(("get-data", launcher_id, None))
+        return 1, []
+
+    async def mint(self, fee=0, wait=False):
+        self.calls.append(("mint", None, wait))
+        return b"\x01" * 32, b"\x02" * 32
+
+    async def add_pair(self, launcher_id, pair, fee=0, wait=False):
+        if launcher_id in self.blocked:
+            await self.blocked[launcher_id].wait()
+        self.calls.append(("add-pair", launcher_id, wait))
+        return b"\x03" * 32
+
+
+def launcher(i: int) -> str:
+    return "0x" + ("%02x" % i) * 32
+
+
+@pytest.mark.asyncio
+async def test_writes_are_ordered_per_launcher():
+    a, b = launcher(1), launcher(2)
+    wallet = RecordingWallet(bytes.fromhex(a[2:]))
+    lines = [
+        line(op="add-pair", launcher_id=a, key="k", value=1, fee=1),
+        line(op="add-pair", launcher_id=b, key="k", value=1, fee=1),
+        line(op="get-data", launcher_id=a),
+        line(op="add-pair", launcher_id=a, key="k", value=2, fee=1),
+        line(op="mint", fee=1),
+        line(op="mint", fee=1),
+    ]
+    results = run_batch(wallet, lines)
+    first = asyncio.ensure_future(results.__anext__())
+    await asyncio.sleep(0.05)
+    # fee paying writes to other launchers and mints don't wait for `a`
+    assert wallet.calls == [
+        ("add-pair", bytes.fromhex(b[2:]), False),
+        ("mint", None, False),
+        ("mint", None, False),
+    ]
+    wallet.blocked[bytes.fromhex(a[2:])].set()
+    assert "error" not in await first
+    assert [result async for result in results][-1]["op"] == "mint"
+    # reads and writes to `a` ran after the write they depend on, which was
+    # waited for to be confirmed
+    assert wallet.calls[3] == ("add-pair", bytes.fromhex(a[2:]), True)
+    assert sorted(wallet.calls[4:]) == [
+        ("add-pair", bytes.fromhex(a[2:]), False),
+        ("get-data", bytes.fromhex(a[2:]), None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_reads_are_bounded():
+    wallet = RecordingWallet()
+    lines = [line(op="get-data", launcher_id=launcher(i)) for i in range(10)]
+    results = [result async for result in run_batch(wallet, lines, 3)]
+    assert len(results) == 10
+    assert wallet.max_reading == 3
@@ -0,0 +1,33 @@
+import click
+from click.testing import CliRunner
+from chia.types.blockchain_format.sized_bytes import bytes32
+
+from beacon_coin.cmd import coro
+from beacon_coin.wallet import CoinNotFound, TxNotConfirmed, TxStatus
+
+
+def test_evicted_transaction_is_reported_without_traceback():
+    @click.command()
+    @coro
+    async def command():
+        raise TxNotConfirmed(bytes32(b"\x01" * 32), TxStatus.EVICTED)
+
+    result = CliRunner().invoke(command)
+    assert result.exit_code == 1
+    assert result.output == (
+        f"Error: Transaction {'01' * 32} was evicted from the mempool, "
+        "nothing was changed on chain.\n"
+    )
+
+
+def test_unknown_coin_is_reported_without_traceback():
+    @click.command()
+    @coro
+    async def command():
+        raise CoinNotFound(bytes32(b"\x01" * 32))
+
+    result = CliRunner().invoke(command)
+    assert result.exit_code == 1
+    assert result.output == (
+        f"Error: Can't find coin: {'01' * 32}, check the launcher ID.\n"
+    )
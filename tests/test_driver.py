@@ -0,0 +1,168 @@
+import pytest
+from blspy import AugSchemeMPL
+from chia.consensus.default_constants import DEFAULT_CONSTANTS
+from chia.types.blockchain_format.coin import Coin
+from chia.types.blockchain_format.program import INFINITE_COST, Program
+from chia.types.blockchain_format.sized_bytes import bytes32
+from chia.types.condition_opcodes import ConditionOpcode
+from chia.types.spend_bundle import SpendBundle
+from chia.util.condition_tools import (
+    conditions_dict_for_solution,
+    pkm_pairs_for_conditions_dict,
+)
+from chia.util.ints import uint64
+from chia.wallet.lineage_proof import LineageProof
+from chia.wallet.puzzles import p2_delegated_puzzle_or_hidden_puzzle
+
+from beacon_coin import driver
+from beacon_coin.wallet import Operation
+
+SK = AugSchemeMPL.key_gen(b"\x01" * 32)
+PK = bytes(SK.get_g1())
+LAUNCHER_ID = bytes32(b"\x02" * 32)
+DATA = [[b"key", b"value"], [b"other", b"x" * 200]]
+
+
+@pytest.fixture(autouse=True)
+def signing_key():
+    driver.register_key(bytes(SK))
+
+
+def conditions(spend_bundle: SpendBundle, coin_spend_index=0):
+    coin_spend = spend_bundle.coin_spends[coin_spend_index]
+    error, result, _ = conditions_dict_for_solution(
+        coin_spend.puzzle_reveal, coin_spend.solution, INFINITE_COST
+    )
+    assert error is None
+    return result
+
+
+def signature_verifies(spend_bundle: SpendBundle) -> bool:
+    pks, msgs = [], []
+    for i, coin_spend in enumerate(spend_bundle.coin_spends):
+        for pk, msg in pkm_pairs_for_conditions_dict(
+            conditions(spend_bundle, i),
+            coin_spend.coin.name(),
+            DEFAULT_CONSTANTS.AGG_SIG_ME_ADDITIONAL_DATA,
+        ):
+            pks.append(pk)
+            msgs.append(msg)
+    assert msgs
+    return AugSchemeMPL.aggregate_verify(pks, msgs, spend_bundle.aggregated_signature)
+
+
+def singleton(mod_hash=driver.BEACON_MOD_HASH) -> Coin:
+    inner_puzzle_hash = driver.beacon_puzzle_hash(
+        Program.to(DATA).get_tree_hash(), 3, PK, mod_hash
+    )
+    return Coin(
+        bytes32(b"\x03" * 32),
+        driver.singleton_puzzle_hash(LAUNCHER_ID, inner_puzzle_hash),
+        uint64(driver.COIN_AMOUNT),
+    )
+
+
+def build_beacon_spend(
+    new_version,
+    new_data,
+    commit=None,
+    new_pub_key=None,
+    mod_hash=driver.BEACON_MOD_HASH,
+):
+    lineage_proof = LineageProof(
+        bytes32(b"\x04" * 32), bytes32(b"\x05" * 32), uint64(driver.COIN_AMOUNT)
+    )
+    spend_bundle, data_hash = driver.build_beacon_spend(
+        bytes(LAUNCHER_ID),
+        driver.coin_to_bytes(singleton(mod_hash)),
+        bytes(lineage_proof),
+        (DATA, 3, PK),
+        new_version,
+        new_data,
+        commit,
+        new_pub_key,
+        mod_hash,
+    )
+    return SpendBundle.from_bytes(spend_bundle), data_hash
+
+
+@pytest.mark.parametrize(
+    "new_version, new_data, commit, new_pub_key",
+    [
+        (4, [[b"new", b"pair"]] + DATA, [Operation.ADD.value, [b"new", b"pair"]], None),
+        (4, DATA[:1], [Operation.REMOVE.value, b"\x01"], None),
+        (0, DATA, None, None),
+        (3, DATA, None, bytes(AugSchemeMPL.key_gen(b"\x06" * 32).get_g1())),
+    ],
+    ids=["commit", "remove", "freeze", "change-owner"],
+)
+def test_beacon_spend(new_version, new_data, commit, new_pub_key):
+    spend_bundle, data_hash = build_beacon_spend(
+        new_version, new_data, commit, new_pub_key
+    )
+    assert spend_bundle.coin_spends[0].coin == singleton()
+    assert signature_verifies(spend_bundle)
+    assert data_hash == Program.to(new_data).get_tree_hash()
+    # next singleton is what the wallet expects to find on chain
+    owner = new_pub_key or PK
+    (create_coin,) = conditions(spend_bundle)[ConditionOpcode.CREATE_COIN]
+    assert create_coin.vars[0] == driver.singleton_puzzle_hash(
+        LAUNCHER_ID, driver.beacon_puzzle_hash(data_hash, new_version, owner)
+    )
+
+
+def test_legacy_beacon_spend():
+    commit = [Operation.ADD.value, [b"new", b"pair"]]
+    spend_bundle, data_hash = build_beacon_spend(
+        4, [[b"new", b"pair"]] + DATA, commit, mod_hash=driver.BEACON_LEGACY_MOD_HASH
+    )
+    assert signature_verifies(spend_bundle)
+    # next singleton is curried with the legacy mod too
+    (create_coin,) = conditions(spend_bundle)[ConditionOpcode.CREATE_COIN]
+    assert create_coin.vars[0] == driver.singleton_puzzle_hash(
+        LAUNCHER_ID,
+        driver.beacon_puzzle_hash(data_hash, 4, PK, driver.BEACON_LEGACY_MOD_HASH),
+    )
+
+
+def test_unknown_beacon_mod():
+    with pytest.raises(ValueError, match="Unknown beacon puzzle"):
+        build_beacon_spend(0, DATA, mod_hash=bytes32(b"\x09" * 32))
+
+
+def standard_coin(amount) -> Coin:
+    puzzle = p2_delegated_puzzle_or_hidden_puzzle.puzzle_for_pk(SK.get_g1())
+    return Coin(bytes32(b"\x07" * 32), puzzle.get_tree_hash(), uint64(amount))
+
+
+def test_fee_spend():
+    coin = standard_coin(100)
+    spend_bundle = SpendBundle.from_bytes(
+        driver.build_fee_spend(PK, driver.coin_to_bytes(coin), 10)
+    )
+    assert signature_verifies(spend_bundle)
+    assert spend_bundle.fees() == 10
+
+
+def test_mint_spend():
+    coin = standard_coin(100)
+    spend_bundle = SpendBundle.from_bytes(
+        driver.build_mint_spend(PK, driver.coin_to_bytes(coin), 10)
+    )
+    assert len(spend_bundle.coin_spends) == 2
+    assert signature_verifies(spend_bundle)
+    assert spend_bundle.fees() == 10
+
+
+def test_signature_of_aggregated_spends():
+    spend_bundle, _ = build_beacon_spend(0, DATA)
+    fee_spend = SpendBundle.from_bytes(
+        driver.build_fee_spend(PK, driver.coin_to_bytes(standard_coin(100)), 10)
+    )
+    assert signature_verifies(SpendBundle.aggregate([spend_bundle, fee_spend]))
+
+
+def test_unknown_key():
+    other = bytes(AugSchemeMPL.key_gen(b"\x08" * 32).get_g1())
+    with pytest.raises(ValueError, match="No key registered"):
+        driver.build_fee_spend(other, driver.coin_to_bytes(standard_coin(100)), 10)
@@ -0,0 +1,76 @@
+import pytest
+from chia.types.blockchain_format.program import Program
+
+from beacon_coin.encoding import decode_value, encode_value, value_report
+
+VALUES = [
+    "plain",
+    "\x00starts with zero",
+    "x" * 300,
+    b"\xff\xfe",
+    0,
+    -5,
+    2 ** 100,
+    None,
+    True,
+    False,
+    [1, "two", [b"3"]],
+    {"nested": {"list": list(range(100))}},
+    {None: 1, True: 2, 3: 4, b"5": 6, "7": 8},
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+@pytest.mark.parametrize("compress_threshold", [None, 1, 128])
+def test_round_trip(value, compress_threshold):
+    assert decode_value(encode_value(value, compress_threshold)) == value
+
+
+def test_plain_strings_are_stored_as_they_are():
+    assert encode_value("plain", 1) == b"plain"
+
+
+def test_compression():
+    raw = encode_value("x" * 300, 128)
+    assert len(raw) < 300
+    assert value_report(raw) == {
+        "stored": len(raw),
+        "uncompressed": 300,
+        "saved": 300 - len(raw),
+    }
+
+
+@pytest.mark.parametrize("value", ["x" * 300, b"\xff", 5, [1, 2]])
+def test_nothing_saved_without_compression(value):
+    assert value_report(encode_value(value))["saved"] == 0
+
+
+@pytest.mark.parametrize(
+    "raw, value",
+    [
+        (b"\x00", "\x00"),
+        (Program.to(128).atom, b"\x00\x80"),
+        (b"\x00\x00zz", "\x00\x00zz"),
+        (b"\x00\x01not zlib", "\x00\x01not zlib"),
+        (b"\xff\xfe", b"\xff\xfe"),
+    ],
+)
+def test_values_not_written_by_encode_value(raw, value):
+    assert decode_value(raw) == value
+    assert value_report(raw)["saved"] == 0
+
+
+def test_tuples_decode_as_lists():
+    assert decode_value(encode_value((1, (2, "3")))) == [1, [2, "3"]]
+
+
+@pytest.mark.parametrize("key", [(1, 2), frozenset([1])])
+def test_unhashable_dict_keys(key):
+    with pytest.raises(ValueError, match="dict key"):
+        encode_value({key: 3})
+
+
+def test_dict_with_list_key_stored_by_something_else():
+    # {[1]: 2} written by hand, the key would decode as an unhashable list
+    raw = b"\x00\x00d" + b"\x04l\x02i\x01" + b"\x02i\x02"
+    assert decode_value(raw) == raw.decode()
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+from chia.types.blockchain_format.sized_bytes import bytes32
+
+from beacon_coin import snapshot
+from beacon_coin.snapshot import BeaconState, Snapshot, write_snapshot
+
+
+def state(i: int, data=None) -> BeaconState:
+    return BeaconState(
+        bytes32(bytes([i]) * 32),
+        bytes32(bytes([i + 100]) * 32),
+        i,
+        i + 1,
+        b"owner",
+        [[b"key", b"value %d" % i]] if data is None else data,
+        bytes32(bytes([i + 200]) * 32),
+    )
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "beacons.snap")
+    states = [state(i) for i in (5, 1, 3)] + [state(7, [])]
+    write_snapshot(path, states)
+    snap = Snapshot(path)
+    assert len(snap) == 4
+    assert list(snap.launcher_ids()) == sorted(s.launcher_id for s in states)
+    for s in states:
+        assert snap.get(s.launcher_id) == s
+    assert snap.get(bytes32(b"\x02" * 32)) is None
+    snap.close()
+
+
+def test_rewrite_while_mapped(tmp_path):
+    path = str(tmp_path / "beacons.snap")
+    write_snapshot(path, [state(1)])
+    snap = Snapshot(path)
+    write_snapshot(path, [state(2)])
+    # already loaded snapshot keeps reading the file it mapped
+    assert snap.get(state(1).launcher_id) == state(1)
+    snap.close()
+    assert Snapshot(path).get(state(2).launcher_id) == state(2)
+    assert os.listdir(tmp_path) == ["beacons.snap"]
+
+
+def test_failed_write_keeps_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "beacons.snap")
+    write_snapshot(path, [state(1)])
+
+    def crash(fd):
+        raise RuntimeError("crash")
+
+    monkeypatch.setattr(snapshot.os, "fsync", crash)
+    with pytest.raises(RuntimeError):
+        write_snapshot(path, [state(2)])
+    assert Snapshot(path).get(state(1).launcher_id) == state(1)
+    assert os.listdir(tmp_path) == ["beacons.snap"]
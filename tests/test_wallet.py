@@ -0,0 +1,252 @@
+import asyncio
+from dataclasses import replace
+from functools import partial
+
+import pytest
+from chia.types.blockchain_format.sized_bytes import bytes32
+
+from beacon_coin import driver
+from beacon_coin.snapshot import write_snapshot
+from beacon_coin.wallet import (
+    CoinNotFound,
+    Operation,
+    TxNotConfirmed,
+    TxStatus,
+    _apply_commit,
+)
+from conftest import BLOCK_TIME
+
+
+@pytest.mark.asyncio
+async def test_waiters_share_one_watcher(wallet, node, farmer):
+    tx_ids = [(await wallet.mint())[0] for _ in range(4)]
+    node.calls.clear()
+    results = await asyncio.gather(
+        *[wallet.wait_for_confirmation([tx_id]) for tx_id in tx_ids]
+    )
+    assert [r[tx_id] for r, tx_id in zip(results, tx_ids)] == [TxStatus.CONFIRMED] * 4
+    # all mints land in the same block, seen by a single lookup
+    assert (
+        node.calls["get_coin_records_by_names"] == node.calls["get_all_mempool_tx_ids"]
+    )
+    assert node.calls["get_coin_records_by_names"] <= 2
+    assert wallet._watcher.done()
+
+
+@pytest.mark.asyncio
+async def test_wait_timeout(wallet):
+    tx_id, _ = await wallet.mint()
+    results = await wallet.wait_for_confirmation([tx_id], timeout=0.1)
+    assert results == {tx_id: TxStatus.PENDING}
+
+
+@pytest.mark.asyncio
+async def test_evicted(wallet, node, farmer):
+    tx_id, _ = await wallet.mint()
+    node.evict(tx_id)
+    with pytest.raises(TxNotConfirmed) as e:
+        await wallet._wait_confirmed(tx_id)
+    assert e.value.status == TxStatus.EVICTED
+    assert await wallet.wait_for_confirmation([tx_id]) == {tx_id: TxStatus.EVICTED}
+    # coin picked for the mint can be used again
+    assert not wallet._reserved_coins
+
+
+@pytest.mark.asyncio
+async def test_held_by_node(wallet, node, sim, farmer, monkeypatch):
+    held = []
+
+    async def push_tx(spend_bundle):
+        # accepted, but kept out of the mempool for now
+        held.append(spend_bundle)
+        return {"success": True, "status": "PENDING"}
+
+    with monkeypatch.context() as m:
+        m.setattr(node, "push_tx", push_tx)
+        tx_id, _ = await wallet.mint(fee=1)
+    results = await wallet.wait_for_confirmation([tx_id], timeout=BLOCK_TIME * 4)
+    assert results == {tx_id: TxStatus.PENDING}
+    # its coin isn't given to another spend while it can still land
+    assert wallet._reserved_coins
+    await node.push_tx(held[0])
+    assert await wallet.wait_for_confirmation([tx_id]) == {tx_id: TxStatus.CONFIRMED}
+    assert not wallet._reserved_coins
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates(wallet, node, farmer):
+    # more mints than wallet coins, later ones wait for change of earlier ones
+    minted = await asyncio.gather(*[wallet.mint(fee=1, wait=True) for _ in range(6)])
+    launcher_ids = [launcher_id for _, launcher_id in minted]
+    first_version, _ = await wallet.get_data(launcher_ids[0])
+
+    async def update(launcher_id, i):
+        if i % 2:
+            return await wallet.set_pair(
+                launcher_id, f"k{i}", f"v{i}", fee=1, wait=True
+            )
+        return await wallet.add_pair(launcher_id, (f"k{i}", f"v{i}"), wait=True)
+
+    # every spend is pushed, none is rejected by the mempool as a double spend
+    await asyncio.gather(
+        *[update(launcher_id, i) for launcher_id in launcher_ids for i in range(3)]
+    )
+    for launcher_id in launcher_ids:
+        version, data = await wallet.get_data(launcher_id)
+        assert version == first_version + 3
+        assert sorted(data) == [(f"k{i}", f"v{i}") for i in range(3)]
+    assert not wallet._reserved_coins
+    assert not wallet._pending
+
+
+@pytest.mark.asyncio
+async def test_failed_build_releases_coin(wallet, monkeypatch):
+    async def build(*args):
+        raise RuntimeError("build failed")
+
+    monkeypatch.setattr(wallet.builder, "build", build)
+    with pytest.raises(RuntimeError):
+        await wallet.mint()
+    assert not wallet._reserved_coins
+
+
+async def beacon(wallet, *pairs):
+    _, launcher_id = await wallet.mint(wait=True)
+    for pair in pairs:
+        await wallet.add_pair(launcher_id, pair, wait=True)
+    return launcher_id
+
+
+@pytest.mark.asyncio
+async def test_state_keeps_mod_hash(wallet, farmer):
+    launcher_id = await beacon(wallet, ("a", "1"), ("b", "2"))
+    state = await wallet.get_state(launcher_id)
+    assert state.mod_hash == driver.BEACON_MOD_HASH
+    assert await wallet.get_data(launcher_id) == (3, [("b", "2"), ("a", "1")])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda state: replace(state, coin_id=bytes32(b"\x09" * 32)),
+        lambda state: replace(state, data=[], data_hash=None),
+        lambda state: replace(state, mod_hash=bytes32(b"\x09" * 32), data_hash=None),
+    ],
+    ids=["missing-tip", "wrong-data", "wrong-mod"],
+)
+async def test_corrupt_cache_is_repaired(wallet, farmer, corrupt):
+    launcher_id = await beacon(wallet, ("a", "1"))
+    state = await wallet.get_state(launcher_id)
+    wallet._states[launcher_id] = corrupt(state)
+    assert await wallet.get_state(launcher_id) == state
+    wallet._states[launcher_id] = corrupt(state)
+    # spends don't build on the corrupt state either
+    await wallet.set_pair(launcher_id, "a", "2", wait=True)
+    assert await wallet.get_data(launcher_id) == (3, [("a", "2")])
+
+
+@pytest.mark.asyncio
+async def test_corrupt_snapshot_is_bypassed(wallet, farmer, tmp_path):
+    good, bad = [await beacon(wallet, ("a", "1")) for _ in range(2)]
+    states = [await wallet.get_state(launcher_id) for launcher_id in (good, bad)]
+    path = str(tmp_path / "beacons.snap")
+    write_snapshot(path, [states[0], replace(states[1], data=[[b"a", b"2"]])])
+
+    wallet.load_snapshot(path)
+    assert await wallet.refresh_snapshot() == (1, {})
+    assert await wallet.get_state(bad) == states[1]
+    # the wrong entry isn't read from the snapshot again
+    wallet._states.clear()
+    assert await wallet.get_state(bad) == states[1]
+
+
+@pytest.mark.asyncio
+async def test_refresh_after_failed_catch_up(wallet, farmer, tmp_path, monkeypatch):
+    launcher_id = await beacon(wallet, ("a", "1"))
+    state = await wallet.get_state(launcher_id)
+    path = str(tmp_path / "beacons.snap")
+    write_snapshot(path, [replace(state, data=[[b"a", b"2"]])])
+    wallet.load_snapshot(path)
+    get_state = wallet.get_state
+
+    async def failing_get_state(launcher_id):
+        raise RuntimeError("node went away")
+
+    monkeypatch.setattr(wallet, "get_state", failing_get_state)
+    stale, failures = await wallet.refresh_snapshot()
+    assert (stale, list(failures)) == (1, [launcher_id])
+    # the beacon has no cached state left, it's caught up from the launcher
+    monkeypatch.setattr(wallet, "get_state", get_state)
+    assert await wallet.refresh_snapshot() == (1, {})
+    assert await wallet.get_state(launcher_id) == state
+
+
+@pytest.mark.asyncio
+async def test_export_skips_failed_beacons(wallet, farmer, tmp_path, monkeypatch):
+    good, bad = [await beacon(wallet, ("a", "1")) for _ in range(2)]
+    get_state = wallet.get_state
+
+    async def failing_get_state(launcher_id):
+        if launcher_id == bad:
+            raise RuntimeError("node went away")
+        return await get_state(launcher_id)
+
+    monkeypatch.setattr(wallet, "get_state", failing_get_state)
+    path = str(tmp_path / "beacons.snap")
+    states, failures = await wallet.export_snapshot(path, [good, bad])
+    assert [state.launcher_id for state in states] == [good]
+    assert list(failures) == [bad]
+    assert str(failures[bad]) == "node went away"
+
+
+@pytest.mark.asyncio
+async def test_legacy_beacon(wallet, farmer, monkeypatch):
+    with monkeypatch.context() as m:
+        # mint the way versions before REPLACE, REMOVE_KEY and UPSERT did
+        m.setattr(
+            driver,
+            "create_beacon_puzzle",
+            partial(driver.create_beacon_puzzle, mod=driver.BEACON_LEGACY_MOD),
+        )
+        launcher_id = await beacon(wallet)
+    await wallet.add_pair(launcher_id, ("a", "1"), wait=True)
+    await wallet.add_pair(launcher_id, ("b", "2"), wait=True)
+    await wallet.remove_pair_at(launcher_id, 1, wait=True)
+    state = await wallet.get_state(launcher_id)
+    assert state.mod_hash == driver.BEACON_LEGACY_MOD_HASH
+    assert await wallet.get_data(launcher_id) == (4, [("b", "2")])
+    with pytest.raises(ValueError, match="UPSERT isn't supported"):
+        await wallet.set_pair(launcher_id, "b", "3")
+    assert not wallet._reserved_coins
+
+
+@pytest.mark.asyncio
+async def test_unknown_launcher(wallet, farmer, tmp_path):
+    fresh = await beacon(wallet)
+    unknown = bytes32(b"\x09" * 32)
+    assert await wallet.get_data(fresh) == (1, [])
+    with pytest.raises(CoinNotFound):
+        await wallet.get_data(unknown)
+    states, skipped = await wallet.export_snapshot(
+        str(tmp_path / "b.snap"), [unknown, fresh]
+    )
+    assert states == []
+    assert isinstance(skipped[unknown], CoinNotFound)
+    assert str(skipped[fresh]) == "Beacon has no spends yet"
+
+
+@pytest.mark.parametrize("index", [b"\xff", b"\x02"], ids=["negative", "past-end"])
+def test_replay_remove_ignores_bad_index(index):
+    data = [[b"a", b"1"], [b"b", b"2"]]
+    assert _apply_commit(list(data), Operation.REMOVE.value, [index]) == data
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index", [-1, 1])
+async def test_remove_bad_index(wallet, farmer, index):
+    launcher_id = await beacon(wallet, ("a", "1"))
+    with pytest.raises(IndexError, match="Bad index"):
+        await wallet.remove_pair_at(launcher_id, index, fee=1)
+    assert not wallet._reserved_coins
+    assert await wallet.get_data(launcher_id) == (2, [("a", "1")])